@@ -1,15 +1,28 @@
-from flask import Flask, render_template, Response, request, send_file
+from flask import Flask, render_template, Response, request, send_file, jsonify
 import cv2
 import numpy as np
 import base64
 import requests
 import os
 import time
+import queue
+from concurrent.futures import CancelledError
 from datetime import datetime
 
+from model_registry import get_model_stats
+from result_cache import ResultCache, image_cache_key
+from camera_stream import (get_camera_stream, get_camera_stats, get_camera_health, load_camera_config,
+                           FramePacer, DEFAULT_STREAM_FPS, MAX_STREAM_FPS, HEALTH_DOWN)
+from inference_pool import InferencePool
+from process_pool import ProcessInferencePool
+from pipelined_executor import PipelinedExecutor
+from live_detection import get_live_detector, find_live_detector, get_live_detection_stats, DETECTIONS_VIEW
+from motion_gate import MotionGate
+
 # ניסיון לייבא את מודול החיזוי, עם טיפול בשגיאות
 try:
-    from inference_pipeline_update import predict_frame
+    from inference_pipeline_update import (predict_frame, predict_frames, get_throughput_stats, get_agreement_stats,
+                                           preload_models, model_version, detect_frame, classify_detections)
 except ImportError:
     # פונקציית דמה במקרה שהמודול חסר
     def predict_frame(frame):
@@ -23,6 +36,27 @@ except ImportError:
             }
         ]
 
+    def predict_frames(images):
+        return [predict_frame(image) for image in images]
+
+    def get_throughput_stats():
+        return {}
+
+    def get_agreement_stats():
+        return {}
+
+    def preload_models():
+        pass
+
+    def model_version():
+        return "dummy"
+
+    def detect_frame(image_rgb):
+        return predict_frame(image_rgb)
+
+    def classify_detections(image_rgb, detections):
+        return detections
+
 # וודא שהנתיב לתבניות נכון
 app = Flask(__name__, 
             template_folder='templates',  # נתיב לתיקיית התבניות
@@ -38,121 +72,229 @@ os.makedirs(SNAPSHOT_FOLDER, exist_ok=True)
 LOCAL_CAMERA_INDEX = 0  # מצלמה מקומית
 DROIDCAM_URL = "http://192.168.1.49:4747/video"  # כתובת DroidCam
 
-def get_camera():
+# מטמון תוצאות חיזוי לפי תוכן התמונה וגרסת המודלים
+RESULT_CACHE_MAX_ENTRIES = 256
+RESULT_CACHE_MAX_MB = 64
+result_cache = ResultCache(max_entries=RESULT_CACHE_MAX_ENTRIES,
+                           max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024)
+
+# מצלמות לפי שם, לכל אחת קורא משלה. קובץ JSON שנתיבו במשתנה הסביבה CAMERA_CONFIG
+# מגדיר את המצלמות, למשל {"station1": "http://192.168.1.50:4747/video", "local": 0}
+CAMERA_CONFIG = load_camera_config(os.environ.get("CAMERA_CONFIG"), {"droidcam": DROIDCAM_URL})
+CAMERA_SOURCES = {name: camera["source"] for name, camera in CAMERA_CONFIG.items()}
+# המצלמה של /video_feed ו-/capture כשלא צוין שם מצלמה
+DEFAULT_CAMERA = next(iter(CAMERA_SOURCES))
+# כמה שניות לחכות לפריים חדש לפני שמציגים ללקוח את מצב המצלמה
+FRAME_WAIT_TIMEOUT = 1.0
+# כמה שניות /capture מחכה לפריים כשאין פריים בחוצץ או כשמבקשים פריים חדש (fresh=1)
+CAPTURE_WAIT_TIMEOUT = 3.0
+
+# מאגר חיזוי משותף לכל המצלמות: תור חסום לכל מקור ותזמון הוגן ביניהם.
+# עם יותר מחוט אחד, כל מודל עדיין רץ בקריאה אחת בכל פעם (נעילה לכל מודל ב-inference_pipeline_update),
+# כך שהחוטים מריצים במקביל רק את הגלאי והמסווג של בקשות שונות
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "1"))
+INFERENCE_QUEUE_PER_SOURCE = 2
+# בקשות /predict מחכות בתור משלהן, גדול יותר, כדי שבקשות במקביל יאוחדו לאצווה אחת
+PREDICT_QUEUE_SIZE = 32
+# בקשות חיזוי שמגיעות בתוך חלון הזמן הזה (מילישניות) מאוחדות לאצווה אחת, עד גודל האצווה המרבי
+INFERENCE_BATCH_WINDOW_MS = float(os.environ.get("INFERENCE_BATCH_WINDOW_MS", "10"))
+INFERENCE_MAX_BATCH_SIZE = int(os.environ.get("INFERENCE_MAX_BATCH_SIZE", "8"))
+# כמה שניות בקשת חיזוי מחכה לתוצאה
+PREDICT_TIMEOUT = 60.0
+# מספר תהליכי חיזוי נפרדים, כל אחד עם עותק משלו של המודלים; 0 מריץ את החיזוי בתהליך השרת
+INFERENCE_PROCESSES = int(os.environ.get("INFERENCE_PROCESSES", "0"))
+# מספר המשבצות בזיכרון המשותף שדרכן עוברים הפריימים לתהליכים
+INFERENCE_SHM_SLOTS = int(os.environ.get("INFERENCE_SHM_SLOTS", "16"))
+process_pool = None
+if INFERENCE_PROCESSES > 0:
+    # התהליכים עולים בשימוש הראשון, כך שתהליך ה-reloader של debug לא מפעיל אותם
+    process_pool = ProcessInferencePool(INFERENCE_PROCESSES, num_slots=INFERENCE_SHM_SLOTS)
+    predict_frame = process_pool.remote("predict_frame")
+    predict_frames = process_pool.remote("predict_frames")
+    detect_frame = process_pool.remote("detect_frame")
+    classify_detections = process_pool.remote("classify_detections")
+    # חוט אחד לפחות לכל תהליך, כדי שכל התהליכים יעבדו במקביל
+    INFERENCE_WORKERS = max(INFERENCE_WORKERS, INFERENCE_PROCESSES)
+# שלב הגלאי ושלב המסווג רצים בחוטים נפרדים עם תור חסום ביניהם, כך שהגלאי עובד על הפריים הבא
+# בזמן שהמסווג מסווג את הקודם. PIPELINE_STAGE_QUEUE הוא גודל התור לפני כל שלב
+PIPELINED_INFERENCE = os.environ.get("PIPELINED_INFERENCE", "0") == "1"
+PIPELINE_STAGE_QUEUE = int(os.environ.get("PIPELINE_STAGE_QUEUE", "2"))
+pipelined_executor = None
+if PIPELINED_INFERENCE:
+    pipelined_executor = PipelinedExecutor(detect_frame, classify_detections, queue_size=PIPELINE_STAGE_QUEUE)
+    predict_frame = pipelined_executor.predict_frame
+    predict_frames = pipelined_executor.predict_frames
+    detect_frame = pipelined_executor.detect_frame
+    classify_detections = pipelined_executor.classify_detections
+    # שני חוטים לפחות, כדי שיהיו שני פריימים בצינור בו-זמנית
+    INFERENCE_WORKERS = max(INFERENCE_WORKERS, 2)
+inference_pool = InferencePool(predict_frame, num_workers=INFERENCE_WORKERS,
+                               max_pending_per_source=INFERENCE_QUEUE_PER_SOURCE,
+                               batch_fn=predict_frames, max_batch_size=INFERENCE_MAX_BATCH_SIZE,
+                               batch_window=INFERENCE_BATCH_WINDOW_MS / 1000)
+
+# סף שינוי הסצנה (חלק הפיקסלים שהשתנו) שמתחתיו החיזוי החי משתמש שוב בזיהויים הקודמים; 0 מבטל
+MOTION_GATE_THRESHOLD = float(os.environ.get("MOTION_GATE_THRESHOLD", "0.01"))
+
+def camera_stream_for(camera_name=None):
+    """קורא המצלמה לפי שם (ברירת המחדל אם לא צוין), או None אם אין מצלמה כזו"""
+    name = camera_name or DEFAULT_CAMERA
+    if name not in CAMERA_SOURCES:
+        return None
+    return get_camera_stream(name, CAMERA_SOURCES[name])
+
+def live_detector_for(stream):
+    """החיזוי החי של מצלמה, עם שער תנועה לפי אזורי המצלמה שהוגדרו (motion_include / motion_exclude)"""
+    camera = CAMERA_CONFIG[stream.name]
+    gate = MotionGate(MOTION_GATE_THRESHOLD, camera.get("motion_include"), camera.get("motion_exclude"))
+    return get_live_detector(stream, inference_pool.submit, detect_frame, classify_detections, gate)
+
+def error_frame(text="Camera Error"):
+    """תמונת שגיאה בפורמט JPEG במקום וידאו"""
+    error_img = np.zeros((480, 640, 3), dtype=np.uint8)
+    (text_w, _), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 1, 2)
+    cv2.putText(error_img, text, ((640 - text_w) // 2, 240), 
+                cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    ret, buf = cv2.imencode('.jpg', error_img)
+    return buf.tobytes()
+
+
+def gen_frames(stream, remote_addr=None, fps=DEFAULT_STREAM_FPS, detector=None):
     """
-    Attempts to connect to DroidCam. Retries if connection fails.
+    יצירת מסגרות וידאו עבור הזרמת הווידאו מתוך חוצץ הפריימים המשותף, בקצב של fps פריימים לשנייה.
+    אם הועבר detector, הזיהויים האחרונים שלו מצוירים על כל פריים
     """
-    print(f"Trying to connect to DroidCam at {DROIDCAM_URL}...")
-
-    for attempt in range(5):
-        cap = cv2.VideoCapture(DROIDCAM_URL)
-        time.sleep(0.5)
-        
-        if cap.isOpened():
-            # Try reading a frame to confirm stream is valid
-            ret, frame = cap.read()
-            if ret and frame is not None and frame.size > 0:
-                print(f"✅ Connected to DroidCam on attempt {attempt+1}")
-                return cap
-            else:
-                print(f"⚠️ DroidCam opened but frame is invalid (attempt {attempt+1})")
-                cap.release()
-        else:
-            print(f"❌ Failed to open DroidCam (attempt {attempt+1})")
-            cap.release()
-
-    print("❌ All attempts failed. DroidCam not available.")
-    return None
-
-
-def gen_frames():
-    """יצירת מסגרות וידאו עבור הזרמת הווידאו"""
-    cap = get_camera()
-    if cap is None:
-        # יצירת תמונת שגיאה במקום וידאו
-        error_img = np.zeros((480, 640, 3), dtype=np.uint8)
-        cv2.putText(error_img, "Camera Error", (200, 240), 
-                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        ret, buf = cv2.imencode('.jpg', error_img)
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' +
-               buf.tobytes() + b'\r\n')
-        return
-    
+    if detector is not None:
+        client = stream.add_client(remote_addr, fps, view=DETECTIONS_VIEW)
+        detector.add_viewer()
+        render = detector.draw
+    else:
+        client = stream.add_client(remote_addr, fps)
+        render = None
+    pacer = FramePacer(fps)
     try:
         while True:
-            success, frame = cap.read()
-            if not success:
-                # ניסיון לפתוח את המצלמה מחדש אם אבד חיבור
-                cap.release()
-                time.sleep(0.5)
-                cap = get_camera()
-                if cap is None:
-                    break
+            # המתנה עד לזמן הפריים הבא, בניכוי זמן הקידוד והשליחה
+            pacer.wait()
+            # המתנה לפריים חדש יותר מזה שנשלח ללקוח הזה
+            item = stream.wait_frame(client.last_seq, timeout=FRAME_WAIT_TIMEOUT)
+            if item is None:
+                # אין פריימים - מציגים את מצב המצלמה וממשיכים לחכות, המפקח מתחבר מחדש ברקע
+                health = stream.health()
+                if health["state"] == HEALTH_DOWN:
+                    text = "Camera down - reconnecting"
+                else:
+                    text = "Waiting for camera"
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' +
+                       error_frame(text) + b'\r\n')
                 continue
+            seq, frame, frame_time = item
                 
-            ret, buf = cv2.imencode('.jpg', frame)
-            if not ret:
+            # קידוד JPEG פעם אחת לכל רמת איכות, משותף לכל הלקוחות באותה רמה
+            seq, jpeg = stream.encoded_frame(seq, frame, client.tier, client.view, render)
+            if jpeg is None:
+                client.last_seq = seq
                 continue
                 
+            # מדידת זמן השליחה ללקוח לצורך התאמת רמת האיכות שלו
+            send_start = time.perf_counter()
             yield (b'--frame\r\n'
                    b'Content-Type: image/jpeg\r\n\r\n' +
-                   buf.tobytes() + b'\r\n')
-                   
-            time.sleep(0.05)  # האט מעט את קצב הפריימים
+                   jpeg + b'\r\n')
+            stream.record_sent(client, seq, len(jpeg), time.perf_counter() - send_start, frame_time)
     except Exception as e:
         print(f"Error in gen_frames: {e}")
     finally:
-        # נקה את המשאבים
-        if cap is not None:
-            cap.release()
-
-@app.route('/video_feed')
-def video_feed():
-    """הזנת וידאו חי למצלמה"""
-    return Response(gen_frames(),
+        # הסרת הלקוח - המצלמה עצמה ממשיכה לפעול עבור שאר הלקוחות
+        stream.remove_client(client)
+        if detector is not None:
+            detector.remove_viewer()
+
+@app.route('/video_feed', defaults={'camera_name': None})
+@app.route('/video_feed/<camera_name>')
+def video_feed(camera_name):
+    """הזנת וידאו חי למצלמה (הפרמטר fps קובע את קצב הפריימים המבוקש)"""
+    stream = camera_stream_for(camera_name)
+    if stream is None:
+        return f"Error: Unknown camera: {camera_name}", 404
+    fps = request.args.get('fps', DEFAULT_STREAM_FPS, type=float)
+    fps = min(max(fps, 1), MAX_STREAM_FPS)
+    return Response(gen_frames(stream, request.remote_addr, fps),
+                    mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/detect_feed', defaults={'camera_name': None})
+@app.route('/detect_feed/<camera_name>')
+def detect_feed(camera_name):
+    """וידאו חי עם הזיהויים האחרונים מצוירים עליו; החיזוי רץ ברקע על הפריים החדש ביותר"""
+    stream = camera_stream_for(camera_name)
+    if stream is None:
+        return f"Error: Unknown camera: {camera_name}", 404
+    fps = request.args.get('fps', DEFAULT_STREAM_FPS, type=float)
+    fps = min(max(fps, 1), MAX_STREAM_FPS)
+    detector = live_detector_for(stream)
+    return Response(gen_frames(stream, request.remote_addr, fps, detector),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
-@app.route('/capture')
-def capture():
-    """צילום תמונה ושמירתה בקובץ"""
+@app.route('/capture', defaults={'camera_name': None})
+@app.route('/capture/<camera_name>')
+def capture(camera_name):
+    """צילום תמונה ושמירתה בקובץ (fresh=1 ממתין לפריים חדש במקום האחרון שבחוצץ)"""
     # קבלת שם הקובץ מה-query string
     filename = request.args.get('filename', f'snapshot_{datetime.now().strftime("%Y%m%d_%H%M%S")}.jpg')
     filepath = os.path.join(SNAPSHOT_FOLDER, filename)
     
-    # פתיחת חיבור למצלמה
-    cap = get_camera()
-    if cap is None:
+    # הפריים נלקח מחוצץ המצלמה הרץ ברקע - אין פתיחת חיבור חדש למצלמה
+    stream = camera_stream_for(camera_name)
+    if stream is None:
+        return f"Error: Unknown camera: {camera_name}", 404
+    # אם המצלמה מנותקת עונים מיד, בלי לחכות לחיבור מחדש. מצלמה שרק הופעלה (connecting) אינה מנותקת
+    if stream.health()["state"] == HEALTH_DOWN:
+        return "Error: No camera available", 503
+    item = stream.latest()
+    if item is None or request.args.get('fresh', '0') == '1':
+        # המתנה לפריים הבא שיגיע אחרי הבקשה (או לפריים הראשון אם המצלמה רק התחילה)
+        item = stream.wait_frame(item[0] if item else 0, timeout=CAPTURE_WAIT_TIMEOUT)
+    if item is None:
         return "Error: No camera available", 500
+    seq, frame, frame_time = item
     
-    # נסה מספר פעמים לצלם תמונה
-    success = False
-    for attempt in range(3):
-        success, frame = cap.read()
-        if success and frame is not None and frame.size > 0:
-            break
-        print(f"Capture attempt {attempt+1} failed, retrying...")
-        time.sleep(0.5)
-    
-    # שחרור המצלמה
-    cap.release()
-    
-    # בדוק שהצלחנו לקבל תמונה
-    if not success or frame is None or frame.size == 0:
+    ret, buf = cv2.imencode('.jpg', frame)
+    if not ret:
         return "Error capturing frame", 500
+    jpeg = buf.tobytes()
     
     # שמירת התמונה בתיקייה
     print(f"Saving snapshot to {filepath}")
-    success = cv2.imwrite(filepath, frame)
-    
-    if not success:
+    try:
+        with open(filepath, 'wb') as f:
+            f.write(jpeg)
+    except OSError:
         return f"Error saving image to {filepath}", 500
         
     print("Snapshot saved successfully")
     
     # החזרת התמונה כתגובה בלבד - החיזוי יתבצע בלחיצה על הכפתור
-    ret, buf = cv2.imencode('.jpg', frame)
-    return Response(buf.tobytes(), mimetype='image/jpeg')
+    # זמן הצילום של הפריים מוחזר בכותרות התגובה
+    response = Response(jpeg, mimetype='image/jpeg')
+    response.headers['X-Frame-Timestamp'] = f"{frame_time:.3f}"
+    response.headers['X-Frame-Age'] = f"{time.time() - frame_time:.3f}"
+    return response
+
+def draw_result(rgb, detections):
+    """תמונת התוצאה בפורמט JPEG: תמונת ה-RGB עם תיבות ותוויות הזיהויים"""
+    # שרטוט התוצאות
+    result_img = rgb.copy()
+    for det in detections:
+        x1, y1, x2, y2 = det["bbox"]
+        label = f"{det['class_label']} {det['class_confidence']:.2f}"
+        cv2.rectangle(result_img, (x1, y1), (x2, y2), (255, 0, 0), 2)
+        cv2.putText(result_img, label, (x1, y1-10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
+    
+    # המרה חזרה ל-BGR וקידוד
+    ret, buf = cv2.imencode('.jpg', cv2.cvtColor(result_img, cv2.COLOR_RGB2BGR))
+    return buf.tobytes()
 
 @app.route('/predict')
 def predict():
@@ -174,31 +316,41 @@ def predict():
     if img is None or img.size == 0:
         return "Error: Cannot read image", 500
     
+    result_filename = f"result_{filename}"
+    result_filepath = os.path.join(SNAPSHOT_FOLDER, result_filename)
+    # הכנת נתיב תמונה יחסי לתבנית
+    result_path = f"/static/snapshots/{result_filename}"
+    
+    # אם אותה תמונה כבר נחזתה עם אותם מודלים - מחזירים את התוצאה מהמטמון
+    cache_key = image_cache_key(img, model_version())
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        detections, result_jpeg = cached
+        print(f"Result cache hit, {len(detections)} objects")
+        with open(result_filepath, 'wb') as f:
+            f.write(result_jpeg)
+        return render_template('result.html',
+                            image_path=result_path,
+                            detections=detections)
+    
     # המרה ל-RGB לחיזוי
     rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
     
     # ביצוע החיזוי
     print("Performing prediction...")
     try:
-        detections = predict_frame(rgb)
+        # החיזוי רץ במאגר החיזוי המשותף, לצד המצלמות
+        future = inference_pool.submit("snapshots", rgb, drop_oldest=False, max_pending=PREDICT_QUEUE_SIZE)
+    except queue.Full:
+        return "Error: Server busy, try again", 503
+    try:
+        detections = future.result(timeout=PREDICT_TIMEOUT)
         print(f"Found {len(detections)} objects")
         
-        # שרטוט התוצאות
-        result_img = rgb.copy()
-        for det in detections:
-            x1, y1, x2, y2 = det["bbox"]
-            label = f"{det['class_label']} {det['class_confidence']:.2f}"
-            cv2.rectangle(result_img, (x1, y1), (x2, y2), (255, 0, 0), 2)
-            cv2.putText(result_img, label, (x1, y1-10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 0, 0), 2)
-        
-        # המרה חזרה ל-BGR ושמירה כתמונת תוצאה
-        result_filename = f"result_{filename}"
-        result_filepath = os.path.join(SNAPSHOT_FOLDER, result_filename)
-        cv2.imwrite(result_filepath, cv2.cvtColor(result_img, cv2.COLOR_RGB2BGR))
-        
-        # הכנת נתיב תמונה יחסי לתבנית
-        result_path = f"/static/snapshots/{result_filename}"
+        result_jpeg = draw_result(rgb, detections)
+        with open(result_filepath, 'wb') as f:
+            f.write(result_jpeg)
+        result_cache.put(cache_key, detections, result_jpeg)
         
         return render_template('result.html',
                             image_path=result_path,
@@ -210,6 +362,43 @@ def predict():
         print(error_msg)
         return f"Error during prediction: {str(e)}<br><pre>{error_msg}</pre>", 500
 
+@app.route('/detect/<camera_name>')
+def detect(camera_name):
+    """חיזוי על הפריים האחרון של מצלמה, התוצאה בפורמט JSON"""
+    stream = camera_stream_for(camera_name)
+    if stream is None:
+        return jsonify({"error": f"Unknown camera: {camera_name}"}), 404
+    item = stream.latest()
+    if item is None or stream.health()["state"] == HEALTH_DOWN:
+        return jsonify({"error": "No camera available"}), 503
+    seq, frame, frame_time = item
+    
+    # פריימים של אותה מצלמה שעוד ממתינים בתור מוחלפים בחדש
+    future = inference_pool.submit(stream.name, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    try:
+        detections = future.result(timeout=PREDICT_TIMEOUT)
+    except CancelledError:
+        return jsonify({"error": "Superseded by a newer frame"}), 503
+    return jsonify({
+        "camera": stream.name,
+        "frame_timestamp": frame_time,
+        "detections": detections,
+    })
+
+@app.route('/tracks/<camera_name>')
+def tracks(camera_name):
+    """הזיהויים האחרונים של /detect_feed עבור מצלמה, כולל מזהה מעקב (track_id) לכל אובייקט"""
+    if camera_name not in CAMERA_SOURCES:
+        return jsonify({"error": f"Unknown camera: {camera_name}"}), 404
+    # קריאה בלבד: לא מפעילים חיזוי חי בשביל הבקשה. אם אף אחד לא צפה ב-/detect_feed אין זיהויים
+    detector = find_live_detector(camera_name)
+    detections, frame_time = detector.detections() if detector is not None else ([], None)
+    return jsonify({
+        "camera": camera_name,
+        "frame_timestamp": frame_time,
+        "detections": detections,
+    })
+
 @app.route('/camera')
 def camera():
     """עמוד המצלמה"""
@@ -223,6 +412,32 @@ def camera():
         available_templates = os.listdir(templates_dir) if os.path.exists(templates_dir) else []
         return f"Error: Camera template not found. Available templates: {available_templates}", 500
 
+def server_stats():
+    """סטטיסטיקות הביצועים של השרת (משותף ל-/stats כאן ובמצב asyncio)"""
+    return {
+        "models": get_model_stats(),
+        "pipeline": get_throughput_stats(),
+        "stage_agreement": get_agreement_stats(),
+        "result_cache": result_cache.stats(),
+        "cameras": get_camera_stats(),
+        "inference_pool": inference_pool.stats(),
+        "inference_processes": process_pool.stats() if process_pool is not None else None,
+        "pipelined_inference": pipelined_executor.stats() if pipelined_executor is not None else None,
+        "live_detection": get_live_detection_stats(),
+    }
+
+@app.route('/stats')
+def stats():
+    """סטטיסטיקות ביצועים של השרת בפורמט JSON"""
+    return jsonify(server_stats())
+
+@app.route('/health')
+def health():
+    """מצב החיבור של המצלמות (connected / degraded / down) וגיל הפריים האחרון"""
+    cameras = get_camera_health()
+    healthy = all(c["state"] != HEALTH_DOWN for c in cameras.values())
+    return jsonify({"cameras": cameras}), 200 if healthy else 503
+
 @app.route('/')
 def index():
     """עמוד הבית"""
@@ -703,5 +918,20 @@ if __name__ == '__main__':
     # וודא שכל קבצי התבניות קיימים
     ensure_templates_exist()
     
+    # טעינת המודלים פעם אחת לפני קבלת בקשות.
+    # במצב debug רק תהליך הבן של ה-reloader מריץ את השרת, ולכן רק בו טוענים
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        try:
+            if process_pool is not None:
+                # המודלים נטענים בתהליכי החיזוי, לא בתהליך השרת
+                process_pool.start()
+            else:
+                preload_models()
+        except Exception as e:
+            print(f"Warning: could not preload models: {e}")
+        # הפעלת קוראי המצלמות מראש, כדי ש-/capture יחזיר פריים מיד
+        for name in CAMERA_SOURCES:
+            camera_stream_for(name)
+    
     # הפעלת השרת בפורט 5000
     app.run(debug=True, port=5000)
\ No newline at end of file
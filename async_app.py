@@ -0,0 +1,284 @@
+"""
+asyncio serving mode for the camera routes.
+
+With app.py every /video_feed viewer holds a server thread for as long as it
+watches, so a few dozen idle viewers use up the thread pool. This module
+serves /video_feed, /capture, /predict and /camera (plus / , /stats and
+/health) from one asyncio event loop with Quart, reusing app.py's camera
+readers, inference pool, result cache and templates:
+
+- Streams are async generators. Per camera, one FrameBroadcast task waits
+  for new frames on an executor thread and wakes all of the camera's
+  viewers, so a viewer costs a coroutine, not a thread.
+- Blocking work (JPEG encoding, file I/O, drawing) runs on a thread pool of
+  ASYNC_EXECUTOR_THREADS threads. Predictions go through app.py's inference
+  pool and are awaited without holding a thread.
+
+Usage:
+    python async_app.py            (binds ASYNC_BIND, default 0.0.0.0:5000)
+"""
+
+import asyncio
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import cv2
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+from quart import Quart, Response, jsonify, render_template, request
+
+import app as web_app
+from camera_stream import DEFAULT_STREAM_FPS, MAX_STREAM_FPS, HEALTH_DOWN, FramePacer, get_camera_health
+from result_cache import image_cache_key
+
+ASYNC_BIND = os.environ.get("ASYNC_BIND", "0.0.0.0:5000")
+# Threads for encoding, drawing and file I/O; viewers themselves do not hold one
+ASYNC_EXECUTOR_THREADS = int(os.environ.get("ASYNC_EXECUTOR_THREADS", "16"))
+
+app = Quart(__name__, template_folder='templates', static_folder='static')
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
+# Streams run for as long as the client watches
+app.config['RESPONSE_TIMEOUT'] = None
+
+executor = ThreadPoolExecutor(max_workers=ASYNC_EXECUTOR_THREADS, thread_name_prefix="async-io")
+
+
+async def run_blocking(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+
+class FrameBroadcast:
+    """The newest frame of one camera for its async viewers, fetched by a single task."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.viewers = 0
+        self.item = None
+        self._changed = asyncio.Condition()
+        self._task = None
+
+    def add_viewer(self):
+        self.viewers += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def remove_viewer(self):
+        self.viewers -= 1
+
+    async def _run(self):
+        try:
+            while self.viewers > 0:
+                # The camera decodes frames while someone waits for them; this task is that waiter
+                last_seq = self.item[0] if self.item else 0
+                item = await run_blocking(self.stream.wait_frame, last_seq, web_app.FRAME_WAIT_TIMEOUT)
+                if item is None:
+                    continue
+                async with self._changed:
+                    self.item = item
+                    self._changed.notify_all()
+        finally:
+            self._task = None
+
+    async def wait_frame(self, after_seq, timeout):
+        """Like CameraStream.wait_frame, without a thread per waiter."""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: self.item is not None and self.item[0] > after_seq), timeout)
+            except asyncio.TimeoutError:
+                return None
+            return self.item
+
+
+_broadcasts = {}
+
+
+def broadcast_for(stream):
+    # Only touched from the event loop, so no lock
+    broadcast = _broadcasts.get(stream.name)
+    if broadcast is None:
+        broadcast = _broadcasts[stream.name] = FrameBroadcast(stream)
+    return broadcast
+
+
+async def gen_frames(stream, remote_addr=None, fps=DEFAULT_STREAM_FPS):
+    """Async version of app.gen_frames for the raw view."""
+    broadcast = broadcast_for(stream)
+    client = stream.add_client(remote_addr, fps)
+    broadcast.add_viewer()
+    pacer = FramePacer(fps)
+    try:
+        while True:
+            await asyncio.sleep(pacer.delay())
+            item = await broadcast.wait_frame(client.last_seq, web_app.FRAME_WAIT_TIMEOUT)
+            if item is None:
+                text = "Camera down - reconnecting" if stream.health()["state"] == HEALTH_DOWN \
+                    else "Waiting for camera"
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' +
+                       await run_blocking(web_app.error_frame, text) + b'\r\n')
+                continue
+            seq, frame, frame_time = item
+
+            seq, jpeg = await run_blocking(stream.encoded_frame, seq, frame, client.tier)
+            if jpeg is None:
+                client.last_seq = seq
+                continue
+
+            send_start = time.perf_counter()
+            yield (b'--frame\r\n'
+                   b'Content-Type: image/jpeg\r\n\r\n' +
+                   jpeg + b'\r\n')
+            stream.record_sent(client, seq, len(jpeg), time.perf_counter() - send_start, frame_time)
+    except Exception as e:
+        print(f"Error in async gen_frames: {e}")
+    finally:
+        stream.remove_client(client)
+        broadcast.remove_viewer()
+
+
+@app.route('/video_feed', defaults={'camera_name': None})
+@app.route('/video_feed/<camera_name>')
+async def video_feed(camera_name):
+    stream = web_app.camera_stream_for(camera_name)
+    if stream is None:
+        return f"Error: Unknown camera: {camera_name}", 404
+    fps = request.args.get('fps', DEFAULT_STREAM_FPS, type=float)
+    fps = min(max(fps, 1), MAX_STREAM_FPS)
+    response = Response(gen_frames(stream, request.remote_addr, fps),
+                        mimetype='multipart/x-mixed-replace; boundary=frame')
+    response.timeout = None
+    return response
+
+
+def _save(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _encode_jpeg(frame):
+    ret, buf = cv2.imencode('.jpg', frame)
+    return buf.tobytes() if ret else None
+
+
+@app.route('/capture', defaults={'camera_name': None})
+@app.route('/capture/<camera_name>')
+async def capture(camera_name):
+    filename = request.args.get('filename', f'snapshot_{datetime.now().strftime("%Y%m%d_%H%M%S")}.jpg')
+    filepath = os.path.join(web_app.SNAPSHOT_FOLDER, filename)
+
+    stream = web_app.camera_stream_for(camera_name)
+    if stream is None:
+        return f"Error: Unknown camera: {camera_name}", 404
+    if stream.health()["state"] == HEALTH_DOWN:
+        return "Error: No camera available", 503
+    item = stream.latest()
+    if item is None or request.args.get('fresh', '0') == '1':
+        # A short, bounded wait, so it may hold an executor thread
+        item = await run_blocking(stream.wait_frame, item[0] if item else 0, web_app.CAPTURE_WAIT_TIMEOUT)
+    if item is None:
+        return "Error: No camera available", 500
+    seq, frame, frame_time = item
+
+    jpeg = await run_blocking(_encode_jpeg, frame)
+    if jpeg is None:
+        return "Error capturing frame", 500
+    try:
+        await run_blocking(_save, filepath, jpeg)
+    except OSError:
+        return f"Error saving image to {filepath}", 500
+
+    response = Response(jpeg, mimetype='image/jpeg')
+    response.headers['X-Frame-Timestamp'] = f"{frame_time:.3f}"
+    response.headers['X-Frame-Age'] = f"{time.time() - frame_time:.3f}"
+    return response
+
+
+@app.route('/predict')
+async def predict():
+    filename = request.args.get('filename', '')
+    if not filename:
+        return "Error: No filename provided", 400
+    filepath = os.path.join(web_app.SNAPSHOT_FOLDER, filename)
+    if not os.path.exists(filepath):
+        return f"Error: File not found: {filepath}", 404
+
+    img = await run_blocking(cv2.imread, filepath)
+    if img is None or img.size == 0:
+        return "Error: Cannot read image", 500
+
+    result_filename = f"result_{filename}"
+    result_filepath = os.path.join(web_app.SNAPSHOT_FOLDER, result_filename)
+    result_path = f"/static/snapshots/{result_filename}"
+
+    cache_key = await run_blocking(image_cache_key, img, web_app.model_version())
+    cached = web_app.result_cache.get(cache_key)
+    if cached is not None:
+        detections, result_jpeg = cached
+        await run_blocking(_save, result_filepath, result_jpeg)
+        return await render_template('result.html', image_path=result_path, detections=detections)
+
+    rgb = await run_blocking(cv2.cvtColor, img, cv2.COLOR_BGR2RGB)
+    try:
+        future = web_app.inference_pool.submit("snapshots", rgb, drop_oldest=False,
+                                               max_pending=web_app.PREDICT_QUEUE_SIZE)
+    except queue.Full:
+        return "Error: Server busy, try again", 503
+    try:
+        # The inference pool is the executor: awaiting its future does not hold a thread
+        detections = await asyncio.wait_for(asyncio.wrap_future(future), web_app.PREDICT_TIMEOUT)
+        result_jpeg = await run_blocking(web_app.draw_result, rgb, detections)
+        await run_blocking(_save, result_filepath, result_jpeg)
+        web_app.result_cache.put(cache_key, detections, result_jpeg)
+        return await render_template('result.html', image_path=result_path, detections=detections)
+    except Exception as e:
+        print(f"Error during prediction: {e}")
+        return f"Error during prediction: {str(e)}", 500
+
+
+@app.route('/camera')
+@app.route('/')
+async def camera():
+    return await render_template('camera.html')
+
+
+@app.route('/stats')
+async def stats():
+    return jsonify(web_app.server_stats())
+
+
+@app.route('/health')
+async def health():
+    cameras = get_camera_health()
+    healthy = all(c["state"] != HEALTH_DOWN for c in cameras.values())
+    return jsonify({"cameras": cameras}), 200 if healthy else 503
+
+
+def main():
+    web_app.ensure_templates_exist()
+    try:
+        if web_app.process_pool is not None:
+            web_app.process_pool.start()
+        else:
+            web_app.preload_models()
+    except Exception as e:
+        print(f"Warning: could not preload models: {e}")
+    for name in web_app.CAMERA_SOURCES:
+        web_app.camera_stream_for(name)
+
+    config = Config()
+    config.bind = [ASYNC_BIND]
+    print(f"Serving on {ASYNC_BIND} (asyncio)")
+    asyncio.run(serve(app, config))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,532 @@
+"""
+Shared camera capture for the live stream.
+
+One background thread per camera source reads frames from cv2.VideoCapture
+into a latest-frame buffer. Every /video_feed client reads from that buffer,
+so any number of browser tabs share a single connection to the camera and a
+single decode pipeline. Clients that are slower than the camera simply skip
+to the newest frame; the skipped frames are counted per client.
+
+The thread grab()s every frame as it arrives, which keeps OpenCV's network
+buffer drained, but only retrieve()s (decodes) a frame when a client is
+waiting for one, or every IDLE_DECODE_INTERVAL seconds to keep the buffer
+current for /capture. A client is therefore always handed the frame that was
+grabbed last, never one that sat in the buffer. The grab time of each frame
+is carried to the point where it has been written to the client, giving a
+glass-to-browser latency (minus the camera's own latency and the browser's
+rendering time, which the server cannot see).
+
+Each frame is JPEG-encoded at most once per quality/resolution tier and the
+bytes are shared by every client on that tier. Clients move between tiers
+according to their measured send throughput, so a slow phone gets smaller
+frames instead of holding a server thread on a large write. Streams that
+draw on the frames (such as the live detection overlay) are separate views
+with tiers of their own, and the drawing is also done once per tier.
+
+The thread also supervises the connection: when the camera cannot be opened
+or stops delivering frames it reconnects with exponential backoff and
+jitter, and publishes a health state (connected, degraded or down, plus the
+age of the last frame) that request handlers read instead of blocking.
+"""
+
+import itertools
+import json
+import random
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import cv2
+
+# Reconnect delay: BACKOFF_BASE * 2**failures seconds, capped at BACKOFF_MAX,
+# randomised by +-BACKOFF_JITTER so several cameras do not retry in lockstep
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+BACKOFF_JITTER = 0.3
+# Open/read timeouts of network cameras, so a dead stream cannot block the thread forever
+CAPTURE_TIMEOUT_MS = 5000
+# A connection that drops sooner than this (seconds) counts as a failed attempt for the backoff
+STABLE_CONNECTION = 10.0
+# A connected camera is 'degraded' once its last frame is older than this (seconds)
+DEGRADED_FRAME_AGE = 1.0
+
+# Started, but the first connection attempt has not finished yet
+HEALTH_CONNECTING = "connecting"
+HEALTH_CONNECTED = "connected"
+HEALTH_DEGRADED = "degraded"
+HEALTH_DOWN = "down"
+
+# View of the stream with the camera frames as they are
+RAW_VIEW = "raw"
+
+# (name, scale of the frame size, JPEG quality), from best to cheapest
+JPEG_TIERS = [
+    ("high", 1.0, 95),
+    ("medium", 0.75, 75),
+    ("low", 0.5, 60),
+    ("minimal", 0.35, 45),
+]
+# Frame rate of a stream client that does not ask for one, and the highest it may ask for
+DEFAULT_STREAM_FPS = 20
+MAX_STREAM_FPS = 30
+# A client moves up a tier only when that tier needs less than this share of its throughput
+TIER_UPGRADE_MARGIN = 0.6
+# Weight of the newest sample in the per-client throughput average
+THROUGHPUT_SMOOTHING = 0.2
+# Decode a frame at least this often (seconds) even when no client is waiting
+IDLE_DECODE_INTERVAL = 0.2
+# Number of recent frames the latency percentiles are computed over
+LATENCY_SAMPLES = 500
+# Number of recent frames a client's achieved frame rate is computed over
+FPS_WINDOW = 30
+
+
+def open_camera(source):
+    """Open a cv2.VideoCapture and check it returns a valid frame. None if it does not."""
+    print(f"Trying to connect to camera {source}...")
+    if isinstance(source, str):
+        cap = cv2.VideoCapture(source, cv2.CAP_ANY, [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, CAPTURE_TIMEOUT_MS,
+                                                     cv2.CAP_PROP_READ_TIMEOUT_MSEC, CAPTURE_TIMEOUT_MS])
+    else:
+        cap = cv2.VideoCapture(source)
+
+    if cap.isOpened():
+        # Try reading a frame to confirm stream is valid
+        ret, frame = cap.read()
+        if ret and frame is not None and frame.size > 0:
+            print(f"✅ Connected to camera {source}")
+            return cap
+        print(f"⚠️ Camera {source} opened but frame is invalid")
+    else:
+        print(f"❌ Failed to open camera {source}")
+    cap.release()
+    return None
+
+
+def load_camera_config(config_path, default_sources):
+    """
+    Named camera sources from a JSON file mapping names to stream URLs or device
+    indices, e.g. {"station1": "http://192.168.1.50:4747/video", "local": 0}.
+    A camera can also be given as an object with a "source" key and options,
+    e.g. {"station1": {"source": "http://...", "motion_include": [[0.1, 0.2, 0.9, 1.0]]}}.
+    Returns {name: {"source": ..., options...}}; default_sources if no file is given.
+    """
+    if config_path:
+        with open(config_path, encoding="utf-8") as f:
+            sources = json.load(f)
+        if not isinstance(sources, dict) or not sources:
+            raise ValueError(f"{config_path} must map camera names to sources")
+    else:
+        sources = default_sources
+
+    config = {}
+    for name, entry in sources.items():
+        entry = dict(entry) if isinstance(entry, dict) else {"source": entry}
+        if "source" not in entry:
+            raise ValueError(f"Camera {name} has no source")
+        # Device indices may be written as strings
+        if str(entry["source"]).isdigit():
+            entry["source"] = int(entry["source"])
+        config[name] = entry
+    return config
+
+
+def backoff_delay(failures):
+    """Seconds to wait before reconnect attempt number failures + 1."""
+    delay = min(BACKOFF_BASE * 2 ** failures, BACKOFF_MAX)
+    return delay * random.uniform(1 - BACKOFF_JITTER, 1 + BACKOFF_JITTER)
+
+
+class FramePacer:
+    """
+    Paces a loop to a target frame rate. Sleeps until the next frame slot, so the
+    time spent reading, encoding and sending is taken out of the sleep.
+    """
+
+    def __init__(self, fps):
+        self.fps = fps
+        self.interval = 1.0 / fps
+        self._next = None
+
+    def delay(self):
+        """Seconds until the next frame slot, which is then booked. For callers that sleep themselves (asyncio)."""
+        now = time.perf_counter()
+        if self._next is None:
+            self._next = now
+        delay = self._next - now
+        if delay < -self.interval:
+            # More than a frame behind: start a new schedule instead of sending a burst to catch up
+            self._next = now
+        self._next += self.interval
+        return max(delay, 0.0)
+
+    def wait(self):
+        delay = self.delay()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class JpegTier:
+    """The JPEG encoding of the newest frame at one quality/resolution, shared by its clients."""
+
+    def __init__(self, name, scale, quality):
+        self.name = name
+        self.scale = scale
+        self.quality = quality
+        # Held while encoding, so clients on the same tier wait instead of encoding again
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._jpeg = None
+        self.encodes = 0
+        self.encode_seconds = 0.0
+        self.bytes_encoded = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+
+    def encode(self, seq, frame, render=None):
+        """
+        (seq, JPEG bytes) of the frame, or of a newer one already encoded. Bytes are None on failure.
+        render(frame) returns a new frame to encode instead, and only runs when the frame is encoded.
+        """
+        with self._lock:
+            if self._seq >= seq:
+                return self._seq, self._jpeg
+            start = time.perf_counter()
+            if render is not None:
+                frame = render(frame)
+            if self.scale != 1.0:
+                frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+            ret, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ret:
+                return seq, None
+            self.encode_seconds += time.perf_counter() - start
+            self._seq, self._jpeg = seq, buf.tobytes()
+            self.encodes += 1
+            self.bytes_encoded += len(self._jpeg)
+            return self._seq, self._jpeg
+
+    @property
+    def avg_frame_bytes(self):
+        return self.bytes_encoded / self.encodes if self.encodes else 0.0
+
+    def stats(self, elapsed, num_clients):
+        return {
+            "scale": self.scale,
+            "quality": self.quality,
+            "clients": num_clients,
+            "encodes": self.encodes,
+            "avg_encode_ms": 1000 * self.encode_seconds / self.encodes if self.encodes else None,
+            "avg_frame_bytes": self.avg_frame_bytes,
+            "frames_sent": self.frames_sent,
+            "bytes_per_sec": self.bytes_sent / elapsed if elapsed else 0.0,
+        }
+
+
+class StreamClient:
+    """Throughput and dropped-frame counters of one stream client."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, remote_addr=None, target_fps=DEFAULT_STREAM_FPS, view=RAW_VIEW):
+        self.id = next(self._ids)
+        self.view = view
+        self.remote_addr = remote_addr
+        self.target_fps = target_fps
+        self._send_times = deque(maxlen=FPS_WINDOW)
+        self.connected_at = time.time()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.bytes_sent = 0
+        self.last_seq = 0
+        self.latency = None
+        # Index into JPEG_TIERS; new clients start on the best tier
+        self.tier = 0
+        # Smoothed bytes/sec of the client's writes, None until the first frame
+        self.throughput = None
+
+    def record_frame(self, seq, num_bytes, send_seconds, latency):
+        # Frames published by the capture thread since the previous one this client sent
+        if self.last_seq:
+            self.frames_dropped += max(seq - self.last_seq - 1, 0)
+        self.last_seq = seq
+        self.frames_sent += 1
+        self.bytes_sent += num_bytes
+        self._send_times.append(time.perf_counter())
+        sample = num_bytes / max(send_seconds, 1e-3)
+        if self.throughput is None:
+            self.throughput = sample
+        else:
+            self.throughput += THROUGHPUT_SMOOTHING * (sample - self.throughput)
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += THROUGHPUT_SMOOTHING * (latency - self.latency)
+
+    def achieved_fps(self):
+        """Frame rate over the last FPS_WINDOW frames sent."""
+        if len(self._send_times) < 2:
+            return None
+        return (len(self._send_times) - 1) / max(self._send_times[-1] - self._send_times[0], 1e-6)
+
+    def stats(self):
+        elapsed = max(time.time() - self.connected_at, 1e-6)
+        return {
+            "id": self.id,
+            "remote_addr": self.remote_addr,
+            "connected_seconds": round(elapsed, 1),
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "bytes_sent": self.bytes_sent,
+            "target_fps": self.target_fps,
+            "achieved_fps": self.achieved_fps(),
+            "avg_fps": self.frames_sent / elapsed,
+            "bytes_per_sec": self.bytes_sent / elapsed,
+            "view": self.view,
+            "tier": JPEG_TIERS[self.tier][0],
+            "throughput_bytes_per_sec": self.throughput,
+            "latency_ms": 1000 * self.latency if self.latency is not None else None,
+        }
+
+
+class CameraStream:
+    """Background capture thread of one camera source with a shared latest-frame buffer."""
+
+    def __init__(self, name, source):
+        self.name = name
+        self.source = source
+        self._cond = threading.Condition()
+        self._frame = None
+        self._frame_time = None
+        # Sequence number of the last grabbed frame and of the last decoded one
+        self._grab_seq = 0
+        self._seq = 0
+        self._waiters = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._clients = {}
+        # JPEG tiers of every view of the stream, created on first use
+        self._tiers = {}
+        self.frames_captured = 0
+        self.frames_decoded = 0
+        self.reconnects = 0
+        # Connection state, written by the capture thread only
+        self._connected = False
+        self._grab_time = None
+        self._failures = 0
+        self._next_retry = None
+        self.started_at = None
+        self._thread = None
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self.started_at = time.time()
+                self._thread = threading.Thread(target=self._run, name=f"camera-{self.name}", daemon=True)
+                self._thread.start()
+        return self
+
+    def _wait_before_retry(self):
+        # Back off exponentially; handlers see the camera as down meanwhile
+        delay = backoff_delay(self._failures)
+        self._failures += 1
+        self._next_retry = time.time() + delay
+        print(f"Camera {self.name}: retrying in {delay:.1f}s")
+        time.sleep(delay)
+        self._next_retry = None
+
+    def _run(self):
+        cap = None
+        connected_at = None
+        while True:
+            if cap is None:
+                try:
+                    cap = open_camera(self.source)
+                except Exception as e:
+                    print(f"Camera {self.name}: error opening camera: {e}")
+                if cap is None:
+                    self._wait_before_retry()
+                    continue
+                self._connected = True
+                connected_at = time.time()
+
+            if not cap.grab():
+                # Lost the connection: reopen it in this thread, clients keep waiting on the buffer
+                print(f"Camera {self.name}: read failed, reconnecting")
+                cap.release()
+                cap = None
+                self._connected = False
+                self.reconnects += 1
+                if time.time() - connected_at < STABLE_CONNECTION:
+                    # A camera that keeps dropping right after connecting is backed off too
+                    self._wait_before_retry()
+                continue
+            if self._failures and time.time() - connected_at >= STABLE_CONNECTION:
+                self._failures = 0
+            grab_time = time.time()
+            self._grab_time = grab_time
+
+            with self._cond:
+                self._grab_seq += 1
+                self.frames_captured += 1
+                grab_seq = self._grab_seq
+                decode = self._waiters > 0 or self._frame_time is None or \
+                    grab_time - self._frame_time >= IDLE_DECODE_INTERVAL
+            if not decode:
+                continue
+
+            success, frame = cap.retrieve()
+            if not success or frame is None or frame.size == 0:
+                continue
+            with self._cond:
+                self._frame = frame
+                self._frame_time = grab_time
+                self._seq = grab_seq
+                self.frames_decoded += 1
+                self._cond.notify_all()
+
+    def wait_frame(self, after_seq=0, timeout=None):
+        """
+        (seq, frame, capture time) of the newest frame newer than after_seq, waiting
+        for it up to timeout seconds. None on timeout. Frames are shared, do not modify them.
+        A decoded frame is only returned while no newer one has been grabbed; otherwise
+        the caller waits for the next grab to be decoded.
+        """
+        with self._cond:
+            self._waiters += 1
+            try:
+                ready = self._cond.wait_for(lambda: self._grab_seq == self._seq > after_seq, timeout=timeout)
+            finally:
+                self._waiters -= 1
+            if not ready:
+                return None
+            return self._seq, self._frame, self._frame_time
+
+    def latest(self):
+        """(seq, frame, capture time) of the newest frame, or None before the first one."""
+        with self._cond:
+            if self._seq == 0:
+                return None
+            return self._seq, self._frame, self._frame_time
+
+    def _view_tiers(self, view):
+        with self._cond:
+            tiers = self._tiers.get(view)
+            if tiers is None:
+                tiers = self._tiers[view] = [JpegTier(*tier) for tier in JPEG_TIERS]
+            return tiers
+
+    def encoded_frame(self, seq, frame, tier, view=RAW_VIEW, render=None):
+        """
+        (seq, JPEG bytes) of a frame from wait_frame/latest, encoded once per view and
+        tier for all clients. Views other than the raw one pass the render function
+        that draws them (see JpegTier.encode).
+        """
+        return self._view_tiers(view)[tier].encode(seq, frame, render)
+
+    def record_sent(self, client, seq, num_bytes, send_seconds, capture_time):
+        """Account a frame written to a client and move the client to the tier its throughput can sustain."""
+        latency = time.time() - capture_time
+        client.record_frame(seq, num_bytes, send_seconds, latency)
+        with self._cond:
+            self._latencies.append(latency)
+        tiers = self._view_tiers(client.view)
+        tiers[client.tier].frames_sent += 1
+        tiers[client.tier].bytes_sent += num_bytes
+
+        def needed(t):
+            return tiers[t].avg_frame_bytes * client.target_fps
+
+        # Step down as far as needed at once, step up one tier at a time
+        new_tier = client.tier
+        while new_tier < len(tiers) - 1 and needed(new_tier) > client.throughput:
+            new_tier += 1
+        if new_tier == client.tier and new_tier > 0 and \
+                needed(new_tier - 1) < client.throughput * TIER_UPGRADE_MARGIN:
+            new_tier -= 1
+        client.tier = new_tier
+
+    def add_client(self, remote_addr=None, target_fps=DEFAULT_STREAM_FPS, view=RAW_VIEW):
+        client = StreamClient(remote_addr, target_fps, view)
+        with self._cond:
+            self._clients[client.id] = client
+        return client
+
+    def remove_client(self, client):
+        with self._cond:
+            self._clients.pop(client.id, None)
+
+    def health(self):
+        """
+        Connection state of the camera: connecting (first attempt still running),
+        connected, degraded (frames are late) or down.
+        """
+        now = time.time()
+        grab_age = now - self._grab_time if self._grab_time else None
+        if not self._connected and not self._failures and not self.reconnects:
+            state = HEALTH_CONNECTING
+        elif not self._connected:
+            state = HEALTH_DOWN
+        elif grab_age is None or grab_age > DEGRADED_FRAME_AGE:
+            state = HEALTH_DEGRADED
+        else:
+            state = HEALTH_CONNECTED
+        return {
+            "state": state,
+            "last_frame_age": grab_age,
+            "failed_attempts": self._failures,
+            "retry_in": max(self._next_retry - now, 0.0) if self._next_retry else None,
+        }
+
+    def stats(self):
+        with self._cond:
+            clients = list(self._clients.values())
+            frame_time = self._frame_time
+            latencies = np.array(self._latencies) * 1000
+            views = dict(self._tiers)
+        elapsed = max(time.time() - self.started_at, 1e-6) if self.started_at else None
+        return {
+            "source": str(self.source),
+            "frames_captured": self.frames_captured,
+            "frames_decoded": self.frames_decoded,
+            "capture_fps": self.frames_captured / elapsed if elapsed else 0.0,
+            "reconnects": self.reconnects,
+            "health": self.health(),
+            "last_decoded_frame_age": time.time() - frame_time if frame_time else None,
+            "glass_to_browser_ms": {
+                "p50": float(np.percentile(latencies, 50)),
+                "p95": float(np.percentile(latencies, 95)),
+                "max": float(latencies.max()),
+            } if len(latencies) else None,
+            "clients": [c.stats() for c in clients],
+            "tiers": {
+                view: {tier.name: tier.stats(elapsed, sum(1 for c in clients if c.view == view and c.tier == i))
+                       for i, tier in enumerate(tiers)}
+                for view, tiers in views.items()
+            },
+        }
+
+
+_streams = {}
+_streams_lock = threading.Lock()
+
+
+def get_camera_stream(name, source):
+    """The running CameraStream of a source, started on first use."""
+    with _streams_lock:
+        stream = _streams.get(name)
+        if stream is None:
+            stream = _streams[name] = CameraStream(name, source)
+    return stream.start()
+
+
+def get_camera_health():
+    with _streams_lock:
+        streams = list(_streams.values())
+    return {stream.name: stream.health() for stream in streams}
+
+
+def get_camera_stats():
+    with _streams_lock:
+        streams = list(_streams.values())
+    return {stream.name: stream.stats() for stream in streams}
@@ -0,0 +1,106 @@
+"""
+This script converts the trash classifier (.h5) to TensorFlow Lite:
+- a float16 model (weights stored as float16)
+- an INT8 model (post-training quantization, calibrated on a sample of TacoCropped)
+Both models are then evaluated on the validation split used by
+evaluate_trash_classifier.py and compared with the original .h5 model.
+The pipeline serves them with CLASSIFIER_BACKEND=tflite.
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model
+from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+from evaluate_trash_classifier import create_val_generator
+from prepare_taco_cropped import dataset_dir_for_size
+from model_registry import TFLITE_CLASSIFIER_PATHS, TFLITE_NUM_THREADS, TRASH_CLASSIFIER_PATH
+from tflite_backend import TFLiteClassifier
+
+# Number of training images used to calibrate the INT8 quantization
+CALIBRATION_SAMPLES = 200
+
+
+def calibration_dataset(img_size, num_samples=CALIBRATION_SAMPLES):
+    """Random images from the training split, preprocessed like in training but without augmentation."""
+    datagen = ImageDataGenerator(rescale=1./255, validation_split=0.2)
+    generator = datagen.flow_from_directory(
+        dataset_dir_for_size(img_size[0]),
+        target_size=img_size,
+        batch_size=1,
+        class_mode=None,
+        subset="training",
+        shuffle=True,
+        seed=0
+    )
+    for _ in range(min(num_samples, generator.samples)):
+        yield [next(generator).astype(np.float32)]
+
+
+def convert(saved_model_dir, variant, img_size):
+    converter = tf.lite.TFLiteConverter.from_saved_model(saved_model_dir)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        converter.representative_dataset = lambda: calibration_dataset(img_size)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    else:
+        raise ValueError(f"Unknown TFLite variant: {variant}")
+
+    tflite_model = converter.convert()
+    output_path = TFLITE_CLASSIFIER_PATHS[variant]
+    with open(output_path, "wb") as f:
+        f.write(tflite_model)
+    print(f"Saved {variant} TFLite model to '{output_path}' ({len(tflite_model) / 1e6:.1f} MB).")
+    return output_path
+
+
+def evaluate(predict_fn, img_size):
+    """Accuracy and mean latency per image of predict_fn on the validation split."""
+    val_generator = create_val_generator(dataset_dir_for_size(img_size[0]), img_size, batch_size=32)
+    predictions = []
+    elapsed = 0.0
+    for _ in range(len(val_generator)):
+        batch, _ = next(val_generator)
+        start = time.perf_counter()
+        predictions.append(np.asarray(predict_fn(batch.astype(np.float32))))
+        elapsed += time.perf_counter() - start
+    y_pred = np.argmax(np.concatenate(predictions, axis=0), axis=1)
+    y_true = val_generator.classes
+    return y_pred, float(np.mean(y_pred == y_true)), elapsed / len(y_true) * 1000
+
+
+def main():
+    # The model the pipeline serves (TRASH_CLASSIFIER_PATH), whose name the .tflite paths derive from
+    model = load_model(TRASH_CLASSIFIER_PATH, compile=False)
+    img_size = tuple(model.input_shape[1:3])
+
+    with tempfile.TemporaryDirectory() as saved_model_dir:
+        model.export(saved_model_dir)
+        for variant in TFLITE_CLASSIFIER_PATHS:
+            convert(saved_model_dir, variant, img_size)
+
+    ref_pred, ref_acc, ref_ms = evaluate(lambda batch: model.predict_on_batch(batch), img_size)
+    print()
+    print(f"{'Model':<10}{'Size (MB)':>12}{'Accuracy':>12}{'Delta':>10}{'Agreement':>12}{'ms/image':>10}")
+    print(f"{'h5':<10}{os.path.getsize(TRASH_CLASSIFIER_PATH) / 1e6:>12.1f}{ref_acc:>12.4f}{0:>+10.4f}{1:>12.4f}{ref_ms:>10.2f}")
+    for variant, path in TFLITE_CLASSIFIER_PATHS.items():
+        classifier = TFLiteClassifier(path, num_threads=TFLITE_NUM_THREADS)
+        pred, acc, ms = evaluate(classifier.predict, img_size)
+        agreement = float(np.mean(pred == ref_pred))
+        print(f"{variant:<10}{os.path.getsize(path) / 1e6:>12.1f}{acc:>12.4f}{acc - ref_acc:>+10.4f}"
+              f"{agreement:>12.4f}{ms:>10.2f}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,74 @@
+"""
+Preprocessing of detection crops for the trash classifier.
+
+Crops are letterboxed straight into a reusable, preallocated float32 batch
+buffer with the /255 normalization fused into the copy, so classifying a
+frame does not allocate new arrays for every crop. Box padding and clipping
+is done for all boxes of a frame at once with NumPy.
+"""
+
+import numpy as np
+import cv2
+
+
+def pad_and_clip_boxes(bboxes, image_shape, pad=5):
+    """
+    Pad (N, 4) x1, y1, x2, y2 boxes by `pad` pixels and clip them to the image.
+    Returns the int boxes and a boolean mask of the boxes that are not empty.
+    """
+    boxes = np.asarray(bboxes).reshape(-1, 4).astype(np.int64)
+    height, width = image_shape[:2]
+
+    boxes[:, :2] -= pad
+    boxes[:, 2:] += pad
+    np.clip(boxes[:, 0::2], 0, width, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, height, out=boxes[:, 1::2])
+
+    valid = (boxes[:, 2] > boxes[:, 0]) & (boxes[:, 3] > boxes[:, 1])
+    return boxes, valid
+
+
+class CropPreprocessor:
+    """
+    Letterboxes crops into a preallocated (max_batch_size, size, size, 3)
+    float32 buffer. The buffer is reused between calls, so the array returned
+    by fill() is only valid until the next call. Not thread safe - use one
+    instance per thread.
+    """
+
+    def __init__(self, size=256, max_batch_size=32):
+        self.size = size
+        self.max_batch_size = max_batch_size
+        self.batch = np.zeros((max_batch_size, size, size, 3), dtype=np.float32)
+        # Scratch memory that cv2.resize writes into before normalization
+        self._resized = np.empty(size * size * 3, dtype=np.uint8)
+
+    def fill(self, crops):
+        """Letterbox and normalize up to max_batch_size crops; returns batch[:len(crops)]."""
+        if len(crops) > self.max_batch_size:
+            raise ValueError(f"Got {len(crops)} crops, buffer holds {self.max_batch_size}")
+        for i, crop in enumerate(crops):
+            self._write(i, crop)
+        return self.batch[:len(crops)]
+
+    def _write(self, i, crop):
+        size = self.size
+        h, w = crop.shape[:2]
+        ratio = float(size) / max(h, w)
+        new_w = max(1, int(w * ratio))
+        new_h = max(1, int(h * ratio))
+        top = (size - new_h) // 2
+        left = (size - new_w) // 2
+
+        # A contiguous view of the scratch memory with the exact resized shape
+        resized = self._resized[:new_h * new_w * 3].reshape(new_h, new_w, 3)
+        cv2.resize(crop, (new_w, new_h), dst=resized, interpolation=cv2.INTER_AREA)
+
+        # Black (zero) borders, then the normalized crop in the middle
+        slot = self.batch[i]
+        slot[:top] = 0
+        slot[top + new_h:] = 0
+        slot[top:top + new_h, :left] = 0
+        slot[top:top + new_h, left + new_w:] = 0
+        np.divide(resized, np.float32(255.0), out=slot[top:top + new_h, left:left + new_w],
+                  dtype=np.float32)
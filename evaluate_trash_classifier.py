@@ -6,15 +6,17 @@ from sklearn.metrics import confusion_matrix, classification_report
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 from tensorflow.keras.models import load_model
 
-def evaluate_model():
-    # Path to the cropped TACO dataset – folder structure as before
-    dataset_dir = r"C:\Users\User\Desktop\Noa Project\Taco\TACO-master\data\TacoCropped"
-    batch_size = 32
-    img_size = (256, 256)  # updated size to match model input
-    
+from prepare_taco_cropped import dataset_dir_for_size
+
+# Path to the cropped TACO dataset – folder structure as before
+DATASET_DIR = r"C:\Users\User\Desktop\Noa Project\Taco\TACO-master\data\TacoCropped"
+MODEL_PATH = r"C:\Users\User\Desktop\Noa Project\trash_classifier_taco_cropped.h5"
+
+def create_val_generator(dataset_dir=DATASET_DIR, img_size=(256, 256), batch_size=32):
+    """The validation split (20% of every class folder), in a fixed order."""
     datagen = ImageDataGenerator(rescale=1./255, validation_split=0.2)
     
-    val_generator = datagen.flow_from_directory(
+    return datagen.flow_from_directory(
         dataset_dir,
         target_size=img_size,
         batch_size=batch_size,
@@ -23,16 +25,24 @@ def evaluate_model():
         shuffle=False
     )
 
+def evaluate_model(model_path=MODEL_PATH, dataset_dir=None):
+    batch_size = 32
+
+    model = load_model(model_path)
+    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+    img_size = tuple(model.input_shape[1:3])  # the resolution the model was trained at
+    if dataset_dir is None:
+        # Crops saved at that resolution, as in training
+        dataset_dir = dataset_dir_for_size(img_size[0])
+    
+    val_generator = create_val_generator(dataset_dir, img_size, batch_size)
+
     print("val_generator.class_indices:", val_generator.class_indices)
 
     # הפיכת המילון class_indices למילון הפוך: אינדקס -> שם קטגוריה
     idx_to_class = {v: k for k, v in val_generator.class_indices.items()}
     print("Index to class mapping from val generator:", idx_to_class)
 
-    model_path = r"C:\Users\User\Desktop\Noa Project\trash_classifier_taco_cropped.h5"
-    model = load_model(model_path)
-    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
-    
     predictions = model.predict(val_generator, verbose=1)
     y_pred = np.argmax(predictions, axis=1)
     y_true = val_generator.classes
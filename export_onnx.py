@@ -0,0 +1,141 @@
+"""
+This script exports the trained models to ONNX for the ONNX Runtime backend
+of the inference pipeline (INFERENCE_BACKEND=onnx):
+- yolov8n_taco.pt -> yolov8n_taco.onnx (dynamic batch and image size)
+- trash_classifier_taco_cropped.h5 -> trash_classifier_taco_cropped.onnx
+After exporting, both backends are run on sample images and the differences
+between the ONNX outputs and the original outputs are reported.
+"""
+
+import os
+import sys
+import glob
+import shutil
+
+import cv2
+import numpy as np
+
+from model_registry import (YOLO_MODEL_PATH, TRASH_CLASSIFIER_PATH,
+                            YOLO_ONNX_PATH, TRASH_CLASSIFIER_ONNX_PATH, get_model)
+from crop_preprocessing import CropPreprocessor, pad_and_clip_boxes
+
+# Images used for the parity check
+PARITY_IMAGES_DIR = r"C:\Users\User\Desktop\Noa Project\Taco\TACO-master\data\batch_1"
+PARITY_NUM_IMAGES = 20
+
+# Boxes with at least this IoU are considered the same detection
+PARITY_IOU_THRESHOLD = 0.9
+
+
+def export_yolo():
+    from ultralytics import YOLO
+
+    model = YOLO(YOLO_MODEL_PATH)
+    exported_path = model.export(format="onnx", imgsz=640, dynamic=True, simplify=True)
+    if os.path.abspath(exported_path) != os.path.abspath(YOLO_ONNX_PATH):
+        shutil.move(exported_path, YOLO_ONNX_PATH)
+    print(f"YOLO model exported to '{YOLO_ONNX_PATH}'.")
+
+
+def export_classifier():
+    from keras.models import load_model
+
+    model = load_model(TRASH_CLASSIFIER_PATH, compile=False)
+    model.export(TRASH_CLASSIFIER_ONNX_PATH, format="onnx")
+    print(f"Trash classifier exported to '{TRASH_CLASSIFIER_ONNX_PATH}'.")
+
+
+def box_iou(boxes_a, boxes_b):
+    """IoU matrix between two sets of x1, y1, x2, y2 boxes."""
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+
+
+def check_parity(image_paths):
+    """Compare the ONNX models with the original ones on the given images."""
+    yolo_model = get_model("yolo")
+    yolo_onnx = get_model("yolo_onnx")
+    trash_model = get_model("trash_classifier")
+    trash_onnx = get_model("trash_classifier_onnx")
+
+    ref_detections = 0
+    onnx_detections = 0
+    matched = 0
+    same_class = 0
+    max_box_diff = 0.0
+    max_conf_diff = 0.0
+    crops_checked = 0
+    same_label = 0
+    max_prob_diff = 0.0
+
+    for path in image_paths:
+        image_bgr = cv2.imread(path)
+        if image_bgr is None:
+            continue
+
+        r = yolo_model.predict(source=image_bgr, conf=0.25, verbose=False)[0]
+        ref_boxes = r.boxes.xyxy.cpu().numpy()
+        ref_conf = r.boxes.conf.cpu().numpy()
+        ref_cls = r.boxes.cls.cpu().numpy().astype(np.int64)
+        boxes, conf, cls = yolo_onnx.predict([image_bgr], conf=0.25)[0]
+        ref_detections += len(ref_boxes)
+        onnx_detections += len(boxes)
+
+        if len(ref_boxes) and len(boxes):
+            iou = box_iou(ref_boxes, boxes)
+            best = np.argmax(iou, axis=1)
+            is_match = iou[np.arange(len(ref_boxes)), best] >= PARITY_IOU_THRESHOLD
+            matched += int(is_match.sum())
+            same_class += int((ref_cls[is_match] == cls[best[is_match]]).sum())
+            if np.any(is_match):
+                max_box_diff = max(max_box_diff, float(np.abs(ref_boxes[is_match] - boxes[best[is_match]]).max()))
+                max_conf_diff = max(max_conf_diff, float(np.abs(ref_conf[is_match] - conf[best[is_match]]).max()))
+
+        # The classifiers are compared on the same crops (from the reference boxes)
+        image_rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+        crop_boxes, valid = pad_and_clip_boxes(ref_boxes, image_rgb.shape, pad=5)
+        crops = [image_rgb[y1:y2, x1:x2] for x1, y1, x2, y2 in crop_boxes[valid].tolist()]
+        if not crops:
+            continue
+        preprocessor = CropPreprocessor(size=trash_onnx.input_size, max_batch_size=len(crops))
+        batch = preprocessor.fill(crops)
+        ref_probs = np.asarray(trash_model.predict_on_batch(batch))
+        onnx_probs = trash_onnx.predict(batch)
+        crops_checked += len(crops)
+        same_label += int((np.argmax(ref_probs, axis=1) == np.argmax(onnx_probs, axis=1)).sum())
+        max_prob_diff = max(max_prob_diff, float(np.abs(ref_probs - onnx_probs).max()))
+
+    print("ONNX parity check:")
+    print(f"  Images: {len(image_paths)}")
+    print(f"  Detections: original {ref_detections}, ONNX {onnx_detections}, "
+          f"matched (IoU >= {PARITY_IOU_THRESHOLD}) {matched}, same class {same_class}")
+    print(f"  Max box coordinate difference: {max_box_diff:.2f} px")
+    print(f"  Max detection confidence difference: {max_conf_diff:.4f}")
+    print(f"  Classifier crops: {crops_checked}, same label {same_label}, "
+          f"max probability difference {max_prob_diff:.6f}")
+
+
+def main():
+    export_yolo()
+    export_classifier()
+
+    # A set, because the patterns overlap on case-insensitive file systems
+    image_paths = sorted(set(glob.glob(os.path.join(PARITY_IMAGES_DIR, "*.jpg")) +
+                             glob.glob(os.path.join(PARITY_IMAGES_DIR, "*.JPG")) +
+                             glob.glob(os.path.join(PARITY_IMAGES_DIR, "*.png"))))[:PARITY_NUM_IMAGES]
+    if not image_paths:
+        print(f"No images found in {PARITY_IMAGES_DIR}, skipping the parity check.")
+        return
+    check_parity(image_paths)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
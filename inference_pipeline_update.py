@@ -1,10 +1,12 @@
 import os
+import time
+import threading
 import cv2
 import numpy as np
 import json
-from ultralytics import YOLO
-from keras.models import load_model
-import matplotlib.pyplot as plt
+
+from model_registry import get_model, load_all_models, loaded_model_signature
+from crop_preprocessing import CropPreprocessor, pad_and_clip_boxes
 
 def letterbox_image(img, desired_size=256):
     h, w = img.shape[:2]
@@ -22,64 +24,351 @@ def letterbox_image(img, desired_size=256):
     
     return cv2.copyMakeBorder(resized, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(0, 0, 0))
 
-def predict_frame(image_rgb):
+# "native" runs YOLO through ultralytics (PyTorch) and the classifier through
+# Keras (TensorFlow); "onnx" runs both through ONNX Runtime, so neither
+# framework is imported. Each stage can also be chosen on its own, and the
+# classifier can also run on TFLite ("tflite", see convert_classifier_tflite.py).
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "native")
+DETECTOR_BACKEND = os.environ.get("DETECTOR_BACKEND", "onnx" if INFERENCE_BACKEND == "onnx" else "ultralytics")
+CLASSIFIER_BACKEND = os.environ.get("CLASSIFIER_BACKEND", "onnx" if INFERENCE_BACKEND == "onnx" else "keras")
 
-    yolo_model_path = r"C:\Users\User\Desktop\Noa Project\yolov8n_taco.pt"
-    trash_classifier_path = r"C:\Users\User\Desktop\Noa Project\trash_classifier_taco_cropped.h5"
+# Backend -> name of the model in the model registry
+DETECTOR_MODELS = {"ultralytics": "yolo", "onnx": "yolo_onnx"}
+CLASSIFIER_MODELS = {"keras": "trash_classifier", "onnx": "trash_classifier_onnx",
+                     "tflite": "trash_classifier_tflite"}
 
-    yolo_model = YOLO(yolo_model_path)
-    trash_model = load_model(trash_classifier_path)
-    trash_model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+if DETECTOR_BACKEND not in DETECTOR_MODELS:
+    raise ValueError(f"Unknown detector backend: {DETECTOR_BACKEND}")
+if CLASSIFIER_BACKEND not in CLASSIFIER_MODELS:
+    raise ValueError(f"Unknown classifier backend: {CLASSIFIER_BACKEND}")
 
-    image_with_boxes = image_rgb.copy()
-    image_bgr = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR)
+# How detections get their class label:
+# "two_stage"     - every crop is classified by the trash classifier (original behaviour)
+# "detector_only" - YOLO's own class (it is trained on the same six classes, see taco.yaml),
+#                   the classifier is never run
+# "hybrid"        - YOLO's class when its confidence is at least HYBRID_CONF_THRESHOLD,
+#                   otherwise the classifier's
+# "roi_head"      - a small head on YOLO's own neck features pooled inside each box
+#                   (roi_feature_head.py, trained by train_roi_head.py); needs the
+#                   ultralytics detector backend
+PIPELINE_MODES = ("two_stage", "detector_only", "hybrid", "roi_head")
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "two_stage")
+HYBRID_CONF_THRESHOLD = float(os.environ.get("HYBRID_CONF_THRESHOLD", 0.8))
 
-    results = yolo_model.predict(source=image_bgr, conf=0.25, verbose=False)
-    r = results[0]
-    boxes = r.boxes
-    if boxes is None or len(boxes) == 0:
-        return []
-    
-    bboxes = boxes.xyxy.cpu().numpy()
-    confidences = boxes.conf.cpu().numpy()
-    conf_threshold = 0.5
-    filtered_boxes = [(bbox.astype(int), float(conf)) for bbox, conf in zip(bboxes, confidences) if conf >= conf_threshold]
-
-    trash_classes = {0: "cardboard", 1: "glass", 2: "metal", 3: "paper", 4: "plastic", 5: "trash"}
-
-    detections_list = []
-    for idx, (bbox, conf_det) in enumerate(filtered_boxes):
-        x1, y1, x2, y2 = bbox
-        x1 = max(0, x1 - 5)
-        y1 = max(0, y1 - 5)
-        x2 = min(image_rgb.shape[1], x2 + 5)
-        y2 = min(image_rgb.shape[0], y2 + 5)
-        if x2 <= x1 or y2 <= y1:
+if PIPELINE_MODE not in PIPELINE_MODES:
+    raise ValueError(f"Unknown pipeline mode: {PIPELINE_MODE}")
+if PIPELINE_MODE == "roi_head" and DETECTOR_BACKEND != "ultralytics":
+    raise ValueError("The roi_head pipeline mode needs DETECTOR_BACKEND=ultralytics")
+
+def active_model_names():
+    """Registry names of the models the configured pipeline uses."""
+    names = [DETECTOR_MODELS[DETECTOR_BACKEND]]
+    if PIPELINE_MODE == "roi_head":
+        names.append("roi_head")
+    elif PIPELINE_MODE != "detector_only":
+        names.append(CLASSIFIER_MODELS[CLASSIFIER_BACKEND])
+    return names
+
+def preload_models():
+    """Load and warm up the models of the configured backends."""
+    load_all_models(active_model_names())
+
+def model_version():
+    """
+    Identifies the models and settings that produce the detections.
+    Used to key cached results, so it changes whenever a reloaded model comes
+    from a different file, not when a file is merely replaced on disk.
+    """
+    parts = [DETECTOR_BACKEND, CLASSIFIER_BACKEND, PIPELINE_MODE, str(HYBRID_CONF_THRESHOLD)]
+    parts.extend(loaded_model_signature(name) for name in active_model_names())
+    return "|".join(parts)
+
+# Class index -> label, in the order of the classifier's softmax output
+TRASH_CLASSES = {0: "cardboard", 1: "glass", 2: "metal", 3: "paper", 4: "plastic", 5: "trash"}
+
+# Class index -> label of the YOLO detector, as in taco.yaml
+YOLO_CLASSES = {0: "plastic", 1: "metal", 2: "paper", 3: "glass", 4: "cardboard", 5: "trash"}
+
+# Maximum number of crops classified in a single forward pass
+CLASSIFIER_MAX_BATCH_SIZE = 32
+
+# Each thread gets its own preallocated crop buffer
+_thread_local = threading.local()
+
+# The detector and the classifier are single shared instances, and ultralytics'
+# predictor (like a Keras model) keeps per-call state, so each model runs one
+# call at a time. Different models still run in parallel on different threads.
+_detector_lock = threading.Lock()
+_classifier_lock = threading.Lock()
+
+def _get_preprocessor(size, max_batch_size):
+    preprocessor = getattr(_thread_local, "preprocessor", None)
+    if preprocessor is None or preprocessor.size != size or preprocessor.max_batch_size < max_batch_size:
+        preprocessor = CropPreprocessor(size=size, max_batch_size=max_batch_size)
+        _thread_local.preprocessor = preprocessor
+    return preprocessor
+
+def _run_classifier(batch):
+    """Class probabilities for a preprocessed batch, from the configured backend."""
+    trash_model = get_model(CLASSIFIER_MODELS[CLASSIFIER_BACKEND])
+    with _classifier_lock:
+        if CLASSIFIER_BACKEND == "keras":
+            return np.asarray(trash_model.predict_on_batch(batch))
+        return trash_model.predict(batch)
+
+def classifier_input_size():
+    """Side length of the classifier input, read from the loaded model."""
+    trash_model = get_model(CLASSIFIER_MODELS[CLASSIFIER_BACKEND])
+    if CLASSIFIER_BACKEND == "keras":
+        return int(trash_model.input_shape[1])
+    return trash_model.input_size
+
+def classify_crops(crops, max_batch_size=CLASSIFIER_MAX_BATCH_SIZE):
+    """
+    Classify a list of RGB crops with as few forward passes as possible.
+    Returns an array of class probabilities with one row per crop.
+    """
+    preprocessor = _get_preprocessor(classifier_input_size(), max_batch_size)
+    predictions = []
+    for start in range(0, len(crops), max_batch_size):
+        batch = preprocessor.fill(crops[start:start + max_batch_size])
+        predictions.append(_run_classifier(batch))
+    return np.concatenate(predictions, axis=0)
+
+# Maximum number of frames passed to YOLO in a single call
+DETECTOR_MAX_BATCH_SIZE = 16
+
+# Cumulative throughput of predict_frames, used for sizing hardware
+_throughput_stats = {"images": 0, "batches": 0, "seconds": 0.0}
+_stats_lock = threading.Lock()
+
+# How often the two stages agree on a label, counted whenever both have run
+_agreement_stats = {"compared": 0, "agreed": 0, "classifier_runs": 0, "classifier_skipped": 0, "pairs": {}}
+
+# Print the agreement statistics every this many comparisons
+AGREEMENT_LOG_INTERVAL = 100
+
+def get_agreement_stats():
+    """
+    Agreement between YOLO's class and the classifier's label.
+    pairs maps "yolo_label->classifier_label" to a count. In hybrid mode only
+    the low-confidence detections are compared.
+    """
+    with _stats_lock:
+        stats = dict(_agreement_stats)
+        stats["pairs"] = dict(_agreement_stats["pairs"])
+    stats["agreement_rate"] = stats["agreed"] / stats["compared"] if stats["compared"] else None
+    return stats
+
+def _record_agreement(yolo_label, classifier_label):
+    with _stats_lock:
+        _agreement_stats["compared"] += 1
+        _agreement_stats["agreed"] += int(yolo_label == classifier_label)
+        pair = f"{yolo_label}->{classifier_label}"
+        _agreement_stats["pairs"][pair] = _agreement_stats["pairs"].get(pair, 0) + 1
+        should_log = _agreement_stats["compared"] % AGREEMENT_LOG_INTERVAL == 0
+        compared, agreed = _agreement_stats["compared"], _agreement_stats["agreed"]
+    if should_log:
+        print(f"Detector/classifier agreement: {agreed}/{compared} ({agreed / compared:.1%})")
+
+def get_throughput_stats():
+    """Total images, batches and time spent in predict_frames, plus images/sec."""
+    with _stats_lock:
+        stats = dict(_throughput_stats)
+    stats["images_per_sec"] = stats["images"] / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    return stats
+
+def _ultralytics_outputs(results):
+    outputs = []
+    for r in results:
+        boxes = r.boxes
+        if boxes is None or len(boxes) == 0:
+            outputs.append((np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=np.int64)))
             continue
+        outputs.append((boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(),
+                        boxes.cls.cpu().numpy().astype(np.int64)))
+    return outputs
+
+def _run_detector(images_bgr):
+    """(xyxy boxes, confidences, class ids) for each BGR frame, from the configured backend."""
+    yolo_model = get_model(DETECTOR_MODELS[DETECTOR_BACKEND])
+    with _detector_lock:
+        if DETECTOR_BACKEND == "onnx":
+            return yolo_model.predict(images_bgr, conf=0.25)
+        return _ultralytics_outputs(yolo_model.predict(source=images_bgr, conf=0.25, verbose=False))
 
-        crop = image_rgb[y1:y2, x1:x2]
-        if crop.size == 0:
+def _run_detector_with_roi_head(images_bgr, conf_threshold):
+    """
+    Like _run_detector, but also classifies the boxes above conf_threshold
+    with the ROI head, from the features of the same YOLO pass.
+    Returns (boxes, confidences, class ids, ROI head probabilities) per frame.
+    """
+    roi_classifier = get_model("roi_head")
+    with _detector_lock:
+        results, features, input_hw = roi_classifier.extractor.predict(images_bgr, conf=0.25)
+    outputs = _ultralytics_outputs(results)
+    kept = [bboxes[confidences >= conf_threshold] for bboxes, confidences, _ in outputs]
+    probabilities = roi_classifier.classify(features, kept, [img.shape for img in images_bgr], input_hw)
+
+    per_image = []
+    start = 0
+    for bboxes, confidences, class_ids in outputs:
+        count = int(np.sum(confidences >= conf_threshold))
+        per_image.append((bboxes, confidences, class_ids, probabilities[start:start + count]))
+        start += count
+    return per_image
+
+def detect_boxes(images_rgb, max_batch_size=DETECTOR_MAX_BATCH_SIZE, with_roi_head=False):
+    """
+    Run YOLO on a list of RGB frames, batching them together.
+    Returns, for each frame, a (bboxes, confidences, class ids) tuple of
+    arrays holding the boxes above the confidence threshold. With
+    with_roi_head the tuple also holds the ROI head's class probabilities.
+    """
+    conf_threshold = 0.5
+
+    per_image_boxes = []
+    for start in range(0, len(images_rgb), max_batch_size):
+        images_bgr = [cv2.cvtColor(img, cv2.COLOR_RGB2BGR) for img in images_rgb[start:start + max_batch_size]]
+        if with_roi_head:
+            for bboxes, confidences, class_ids, probabilities in _run_detector_with_roi_head(images_bgr, conf_threshold):
+                keep = confidences >= conf_threshold
+                per_image_boxes.append((bboxes[keep], confidences[keep], class_ids[keep], probabilities))
             continue
+        for bboxes, confidences, class_ids in _run_detector(images_bgr):
+            keep = confidences >= conf_threshold
+            per_image_boxes.append((bboxes[keep], confidences[keep], class_ids[keep]))
+    return per_image_boxes
 
-        crop_resized = letterbox_image(crop, desired_size=256)
-        crop_input = crop_resized.astype("float32") / 255.0
-        crop_input = np.expand_dims(crop_input, axis=0)
+def crop_detections(image_rgb, bboxes, confidences, class_ids):
+    """
+    Pad each box by 5 pixels, clip it to the image and cut out the crop.
+    The crops are views into image_rgb, not copies.
+    Returns the crops and a (bbox, confidence, class id, index into bboxes)
+    tuple for each.
+    """
+    boxes, valid = pad_and_clip_boxes(bboxes, image_rgb.shape, pad=5)
+    crops = []
+    kept_boxes = []
+    for index in np.flatnonzero(valid).tolist():
+        x1, y1, x2, y2 = boxes[index].tolist()
+        crops.append(image_rgb[y1:y2, x1:x2])
+        kept_boxes.append(([x1, y1, x2, y2], float(confidences[index]), int(class_ids[index]), index))
+    return crops, kept_boxes
 
-        prediction = trash_model.predict(crop_input)
-        pred_class_idx = int(np.argmax(prediction, axis=1)[0])
-        confidence_cls = float(prediction[0][pred_class_idx])
-        predicted_label = trash_classes.get(pred_class_idx, "unknown")
+def _apply_classifier(detections, predictions):
+    """Relabel detections in place with the classifier's predictions for their crops."""
+    for detection, prediction in zip(detections, predictions):
+        pred_class_idx = int(np.argmax(prediction))
+        predicted_label = TRASH_CLASSES.get(pred_class_idx, "unknown")
+        detection["class_confidence"] = float(prediction[pred_class_idx])
+        detection["class_label"] = predicted_label
+        detection["label_source"] = "classifier"
+        _record_agreement(detection["yolo_class_label"], predicted_label)
 
-        detections_list.append({
-            "bbox": [int(x1), int(y1), int(x2), int(y2)],
-            "yolo_confidence": conf_det,
-            "class_confidence": confidence_cls,
-            "class_label": predicted_label
-        })
+def predict_frames(images_rgb, max_batch_size=CLASSIFIER_MAX_BATCH_SIZE,
+                   detector_batch_size=DETECTOR_MAX_BATCH_SIZE, mode=None):
+    """
+    Run the full pipeline on a list of RGB frames.
+    YOLO sees the frames in batches, and the crops of all frames that need
+    the classifier (see PIPELINE_MODE, overridable with mode) are classified
+    together in shared classifier batches.
+    Returns one detections list per input frame, in the same order.
+    """
+    if len(images_rgb) == 0:
+        return []
+    mode = mode or PIPELINE_MODE
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown pipeline mode: {mode}")
 
-    return detections_list
+    start_time = time.perf_counter()
+    per_image_boxes = detect_boxes(images_rgb, max_batch_size=detector_batch_size,
+                                   with_roi_head=(mode == "roi_head"))
+
+    # Every detection starts with YOLO's label; the crops that need the
+    # classifier are gathered across frames and relabelled below
+    results = [[] for _ in images_rgb]
+    all_crops = []
+    pending = []
+    # The head's outputs follow the class names saved with it, not TRASH_CLASSES
+    roi_class_names = get_model("roi_head").class_names if mode == "roi_head" else None
+    for image_idx, (image_rgb, detected) in enumerate(zip(images_rgb, per_image_boxes)):
+        bboxes, confidences, class_ids = detected[:3]
+        crops, kept_boxes = crop_detections(image_rgb, bboxes, confidences, class_ids)
+        for crop, (bbox, conf_det, class_id, box_index) in zip(crops, kept_boxes):
+            yolo_label = YOLO_CLASSES.get(class_id, "unknown")
+            detection = {
+                "bbox": bbox,
+                "yolo_confidence": conf_det,
+                "class_confidence": conf_det,
+                "class_label": yolo_label,
+                "yolo_class_label": yolo_label,
+                "label_source": "detector"
+            }
+            results[image_idx].append(detection)
+            if mode == "roi_head":
+                roi_probabilities = detected[3][box_index]
+                roi_class_idx = int(np.argmax(roi_probabilities))
+                detection["class_confidence"] = float(roi_probabilities[roi_class_idx])
+                detection["class_label"] = roi_class_names[roi_class_idx]
+                detection["label_source"] = "roi_head"
+            elif mode == "two_stage" or (mode == "hybrid" and conf_det < HYBRID_CONF_THRESHOLD):
+                all_crops.append(crop)
+                pending.append(detection)
+
+    with _stats_lock:
+        _agreement_stats["classifier_runs"] += len(all_crops)
+        _agreement_stats["classifier_skipped"] += sum(len(r) for r in results) - len(all_crops)
+
+    if all_crops:
+        _apply_classifier(pending, classify_crops(all_crops, max_batch_size=max_batch_size))
+
+    elapsed = time.perf_counter() - start_time
+    with _stats_lock:
+        _throughput_stats["images"] += len(images_rgb)
+        _throughput_stats["batches"] += 1
+        _throughput_stats["seconds"] += elapsed
+
+    return results
+
+def predict_frame(image_rgb, max_batch_size=CLASSIFIER_MAX_BATCH_SIZE, mode=None):
+    return predict_frames([image_rgb], max_batch_size=max_batch_size, mode=mode)[0]
+
+def detect_frame(image_rgb, mode=None):
+    """
+    Detections of one RGB frame with only the labels of the YOLO pass: the
+    detector's own class, or the ROI head's in roi_head mode. The classifier
+    stage can be run on (some of) them later with classify_detections.
+    """
+    mode = mode or PIPELINE_MODE
+    return predict_frame(image_rgb, mode="roi_head" if mode == "roi_head" else "detector_only")
+
+def classify_detections(image_rgb, detections, max_batch_size=CLASSIFIER_MAX_BATCH_SIZE, mode=None):
+    """
+    Run the classifier stage on detections of image_rgb from detect_frame,
+    relabelling in place the ones that PIPELINE_MODE (or mode) sends to the
+    classifier. Their boxes are already padded and clipped, so the crops are
+    the same as in predict_frames. Returns the detections.
+    """
+    mode = mode or PIPELINE_MODE
+    if mode == "two_stage":
+        pending = list(detections)
+    elif mode == "hybrid":
+        pending = [d for d in detections if d["yolo_confidence"] < HYBRID_CONF_THRESHOLD]
+    else:
+        return detections
+    if pending:
+        crops = [image_rgb[y1:y2, x1:x2] for x1, y1, x2, y2 in (d["bbox"] for d in pending)]
+        with _stats_lock:
+            # detect_frame counted these detections as skipped
+            _agreement_stats["classifier_runs"] += len(crops)
+            _agreement_stats["classifier_skipped"] -= len(crops)
+        _apply_classifier(pending, classify_crops(crops, max_batch_size=max_batch_size))
+    return detections
 
 if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+
     # עדכני את הנתיב לתמונת הדוגמה שלך
     sample_image_path = r"C:\Users\User\Desktop\Noa Project\בדיקה2.jpg"
     if not os.path.exists(sample_image_path):
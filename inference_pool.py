@@ -0,0 +1,216 @@
+"""
+Shared inference pool for all camera sources.
+
+Every source (a camera, or the snapshot /predict route) gets its own bounded
+queue of pending frames. Worker threads take jobs from the queues round-robin,
+one job per source per turn, so a camera that submits frames as fast as it
+can never delay another camera by more than one job per worker. When a
+source's queue is full the oldest frame is dropped (it is stale anyway for a
+live camera), or, for submitters that must not lose requests, the new job is
+rejected with queue.Full.
+
+Plain prediction jobs are micro-batched: a worker that picks one up keeps
+collecting further prediction jobs (still round-robin over the sources) for
+up to batch_window seconds or max_batch_size jobs, runs them through
+batch_fn in one go and resolves each caller's future. Concurrent /predict
+requests and several cameras thus share YOLO and classifier batches instead
+of each running batches of one.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+# Number of recent jobs the queueing delay percentiles are computed over
+DELAY_SAMPLES = 1000
+
+
+class _SourceQueue:
+    def __init__(self):
+        self.jobs = deque()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.inference_seconds = 0.0
+
+    def stats(self):
+        done = self.completed + self.failed
+        return {
+            "queued": len(self.jobs),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "avg_wait_ms": 1000 * self.wait_seconds / done if done else None,
+            "avg_inference_ms": 1000 * self.inference_seconds / done if done else None,
+        }
+
+
+class InferencePool:
+    """
+    Worker threads running predict_fn(image) for jobs of several sources, fairly
+    scheduled. With batch_fn(images), prediction jobs are gathered into batches.
+    """
+
+    def __init__(self, predict_fn, num_workers=1, max_pending_per_source=2,
+                 batch_fn=None, max_batch_size=8, batch_window=0.01):
+        self.predict_fn = predict_fn
+        self.batch_fn = batch_fn
+        self.num_workers = num_workers
+        self.max_pending_per_source = max_pending_per_source
+        self.max_batch_size = max_batch_size if batch_fn is not None else 1
+        self.batch_window = batch_window
+        self._sources = {}
+        # Sources in round-robin order; the next worker starts looking at _next_source
+        self._order = []
+        self._next_source = 0
+        self._cond = threading.Condition()
+        self._busy_workers = 0
+        self._batch_sizes = {}
+        self._delays = deque(maxlen=DELAY_SAMPLES)
+        self._workers = []
+        self._workers_pid = None
+
+    def _start_workers(self):
+        # Called with the lock held. The threads start on the first job, and again in a process
+        # forked after that (threads do not survive a fork), e.g. a pre-forked server worker
+        if self._workers_pid == os.getpid():
+            return
+        self._workers_pid = os.getpid()
+        self._workers = [threading.Thread(target=self._work, name=f"inference-{i}", daemon=True)
+                         for i in range(self.num_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, source, image, drop_oldest=True, fn=None, max_pending=None):
+        """
+        Queue image for inference on behalf of source and return a Future of its
+        detections. If the source already has max_pending (default
+        max_pending_per_source) jobs queued, the oldest is cancelled (drop_oldest)
+        or queue.Full is raised.
+        fn(image) replaces predict_fn for this job (e.g. a single pipeline stage);
+        such jobs are not batched.
+        """
+        future = Future()
+        with self._cond:
+            self._start_workers()
+            source_queue = self._sources.get(source)
+            if source_queue is None:
+                source_queue = self._sources[source] = _SourceQueue()
+                self._order.append(source)
+            if len(source_queue.jobs) >= (max_pending or self.max_pending_per_source):
+                if not drop_oldest:
+                    source_queue.rejected += 1
+                    raise queue.Full(f"Inference queue of {source} is full")
+                old_future = source_queue.jobs.popleft()[0]
+                old_future.cancel()
+                source_queue.dropped += 1
+            source_queue.jobs.append((future, fn, image, time.perf_counter()))
+            source_queue.submitted += 1
+            self._cond.notify()
+        return future
+
+    def _take_job(self, batchable_only=False):
+        # Called with the lock held: first job at the head of a queue from the round-robin position
+        for offset in range(len(self._order)):
+            index = (self._next_source + offset) % len(self._order)
+            source_queue = self._sources[self._order[index]]
+            if source_queue.jobs and (not batchable_only or source_queue.jobs[0][1] is None):
+                self._next_source = index + 1
+                return source_queue, source_queue.jobs.popleft()
+        return None
+
+    def _take_batch(self):
+        # Called with the lock held, after a job is available
+        first = self._take_job()
+        batch = [first]
+        if first[1][1] is not None or self.max_batch_size <= 1:
+            return batch
+        deadline = time.perf_counter() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            taken = self._take_job(batchable_only=True)
+            if taken is not None:
+                batch.append(taken)
+                continue
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+        return batch
+
+    def _work(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: any(q.jobs for q in self._sources.values()))
+                batch = self._take_batch()
+                self._busy_workers += 1
+            try:
+                # Jobs cancelled while queued (replaced by a newer frame) are left out
+                batch = [(source_queue, job) for source_queue, job in batch
+                         if job[0].set_running_or_notify_cancel()]
+                if batch:
+                    self._run_batch(batch)
+            finally:
+                with self._cond:
+                    self._busy_workers -= 1
+
+    def _run_batch(self, batch):
+        started_at = time.perf_counter()
+        try:
+            if len(batch) == 1:
+                _, (_, fn, image, _) = batch[0]
+                results = [(fn or self.predict_fn)(image)]
+            else:
+                results = self.batch_fn([image for _, (_, _, image, _) in batch])
+            error = None
+        except Exception as e:
+            results = [None] * len(batch)
+            error = e
+        finished_at = time.perf_counter()
+
+        for (_, (future, _, _, _)), result in zip(batch, results):
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+        with self._cond:
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            for source_queue, (_, _, _, submitted_at) in batch:
+                source_queue.wait_seconds += started_at - submitted_at
+                self._delays.append(started_at - submitted_at)
+                source_queue.inference_seconds += finished_at - started_at
+                if error is None:
+                    source_queue.completed += 1
+                else:
+                    source_queue.failed += 1
+
+    def stats(self):
+        with self._cond:
+            delays = np.array(self._delays) * 1000
+            batches = sum(self._batch_sizes.values())
+            return {
+                "workers": self.num_workers,
+                "busy_workers": self._busy_workers,
+                "max_pending_per_source": self.max_pending_per_source,
+                "queue_depth": sum(len(q.jobs) for q in self._sources.values()),
+                "max_batch_size": self.max_batch_size,
+                "batch_window_ms": 1000 * self.batch_window,
+                "batch_sizes": dict(sorted(self._batch_sizes.items())),
+                "avg_batch_size": sum(size * n for size, n in self._batch_sizes.items()) / batches
+                if batches else None,
+                "queueing_delay_ms": {
+                    "p50": float(np.percentile(delays, 50)),
+                    "p95": float(np.percentile(delays, 95)),
+                    "max": float(delays.max()),
+                } if len(delays) else None,
+                "sources": {name: q.stats() for name, q in self._sources.items()},
+            }
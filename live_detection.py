@@ -0,0 +1,226 @@
+"""
+Live detection overlay for a camera stream.
+
+While at least one client watches a camera's detection stream, a worker
+thread takes the newest frame of the camera, runs it through the inference
+pool and keeps the result. It only asks for the next frame once the previous
+one is done, so frames that arrive while inference is running are skipped
+instead of queueing up. The stream itself keeps the camera's frame rate and
+draws the most recent detections on every outgoing frame, however slowly the
+models run.
+
+With tracking (the default), the detector runs only on every
+DETECT_EVERY_N_FRAMES-th frame, or on the next frame when a track was missed,
+and an IoU/Kalman tracker moves the boxes on the frames in between. The
+classifier only runs on new tracks and on tracks whose box has changed a lot
+since it was classified; other tracks keep their cached label.
+
+An optional motion gate (motion_gate.py) skips frames on which the scene has
+not changed: they keep the previous detections and tracks without any model run.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import CancelledError
+from functools import partial
+
+import cv2
+
+from tracker import IouTracker
+
+# View name of the annotated stream (see camera_stream.CameraStream.encoded_frame)
+DETECTIONS_VIEW = "detections"
+# Seconds the worker waits for a frame or a result before checking for viewers again
+WORKER_WAIT_TIMEOUT = 1.0
+INFERENCE_TIMEOUT = 60.0
+# Run the detector on every N-th frame and track the boxes in between; 0 runs the full pipeline on every frame
+DETECT_EVERY_N_FRAMES = int(os.environ.get("DETECT_EVERY_N_FRAMES", "5"))
+# Color (BGR) and thickness of the boxes drawn on the stream
+BOX_COLOR = (0, 0, 255)
+BOX_THICKNESS = 2
+
+
+class LiveDetector:
+    """Runs inference on the newest frame of one camera while its detection stream has viewers."""
+
+    def __init__(self, stream, submit, detect_fn=None, classify_fn=None, motion_gate=None):
+        # submit(source, image_rgb, fn=None) returns a Future of the detections (InferencePool.submit).
+        # With detect_fn(image_rgb) and classify_fn(image_rgb, detections) the detections are tracked
+        self.stream = stream
+        self.submit = submit
+        self.detect_fn = detect_fn
+        self.classify_fn = classify_fn
+        self.tracking = detect_fn is not None and DETECT_EVERY_N_FRAMES > 0
+        self.tracker = None
+        self.motion_gate = motion_gate
+        self._lock = threading.Lock()
+        self._viewers = 0
+        self._thread = None
+        self._detections = []
+        self._detections_frame_time = None
+        self.inferences = 0
+        self.frames_skipped = 0
+        self.failures = 0
+        self.detector_runs = 0
+        self.classifier_runs = 0
+        self.inference_seconds = 0.0
+        self.result_latency = None
+
+    def add_viewer(self):
+        with self._lock:
+            self._viewers += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"detect-{self.stream.name}", daemon=True)
+                self._thread.start()
+
+    def remove_viewer(self):
+        with self._lock:
+            self._viewers -= 1
+
+    def _infer(self, image_rgb, fn=None):
+        future = self.submit(self.stream.name, image_rgb, fn=fn)
+        return future.result(timeout=INFERENCE_TIMEOUT)
+
+    def _track(self, image_rgb, run_detector):
+        """Tracked detections of a frame, running the detector (and classifier on changed tracks) if asked."""
+        if not run_detector:
+            self.tracker.predict()
+            return self.tracker.detections(image_rgb.shape)
+        to_classify = self.tracker.update(self._infer(image_rgb, self.detect_fn))
+        self.detector_runs += 1
+        if to_classify:
+            self.tracker.set_labels(self._infer(image_rgb, partial(self.classify_fn, detections=to_classify)))
+            self.classifier_runs += len(to_classify)
+        return self.tracker.detections(image_rgb.shape)
+
+    def _run(self):
+        last_seq = 0
+        frames_since_detection = None
+        # Tracks do not survive a pause in viewing
+        self.tracker = IouTracker() if self.tracking else None
+        self._reset_gate()
+        while True:
+            with self._lock:
+                if self._viewers <= 0:
+                    # Nobody is watching: stop, the next viewer starts a new worker
+                    self._thread = None
+                    return
+
+            item = self.stream.wait_frame(last_seq, timeout=WORKER_WAIT_TIMEOUT)
+            if item is None:
+                continue
+            seq, frame, frame_time = item
+            if last_seq:
+                self.frames_skipped += seq - last_seq - 1
+            last_seq = seq
+
+            if self.motion_gate is not None and self.motion_gate.unchanged(frame):
+                # Static scene: the previous detections still hold, only their frame time moves on
+                with self._lock:
+                    self._detections_frame_time = frame_time
+                continue
+
+            start = time.perf_counter()
+            try:
+                image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                if self.tracker is None:
+                    detections = self._infer(image_rgb)
+                else:
+                    run_detector = frames_since_detection is None or \
+                        frames_since_detection + 1 >= DETECT_EVERY_N_FRAMES or self.tracker.has_unmatched_tracks()
+                    detections = self._track(image_rgb, run_detector)
+                    frames_since_detection = 0 if run_detector else frames_since_detection + 1
+            except CancelledError:
+                # Replaced in the pool's queue by a newer frame of the same camera
+                self._reset_gate()
+                continue
+            except Exception as e:
+                print(f"Live detection on {self.stream.name} failed: {e}")
+                self.failures += 1
+                self._reset_gate()
+                time.sleep(WORKER_WAIT_TIMEOUT)
+                continue
+
+            with self._lock:
+                self._detections = detections
+                self._detections_frame_time = frame_time
+                self.inferences += 1
+                self.inference_seconds += time.perf_counter() - start
+                self.result_latency = time.time() - frame_time
+
+    def _reset_gate(self):
+        # The gate's reference frame has no detections, so the next frame must run
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+
+    def detections(self):
+        """The most recent detections (with track_id when tracking) and the capture time of their frame."""
+        with self._lock:
+            return list(self._detections), self._detections_frame_time
+
+    def draw(self, frame):
+        """Copy of a BGR frame with the most recent detections drawn on it."""
+        with self._lock:
+            detections = self._detections
+        annotated = frame.copy()
+        for det in detections:
+            x1, y1, x2, y2 = det["bbox"]
+            label = f"{det['class_label']} {det['class_confidence']:.2f}"
+            if "track_id" in det:
+                label = f"#{det['track_id']} {label}"
+            cv2.rectangle(annotated, (x1, y1), (x2, y2), BOX_COLOR, BOX_THICKNESS)
+            cv2.putText(annotated, label, (x1, max(y1 - 10, 15)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, BOX_COLOR, BOX_THICKNESS)
+        return annotated
+
+    def stats(self):
+        tracker = self.tracker
+        with self._lock:
+            return {
+                "viewers": self._viewers,
+                "running": self._thread is not None,
+                "tracking": self.tracking,
+                "detect_every_n_frames": DETECT_EVERY_N_FRAMES if self.tracking else 1,
+                "frames_processed": self.inferences,
+                "detector_runs": self.detector_runs if self.tracking else self.inferences,
+                "classifier_runs": self.classifier_runs,
+                "tracks": len(tracker.tracks) if tracker else None,
+                "tracks_lost": tracker.lost_tracks if tracker else None,
+                "cached_label_reuses": tracker.label_reuses if tracker else None,
+                "failures": self.failures,
+                "frames_skipped": self.frames_skipped,
+                "avg_processing_ms": 1000 * self.inference_seconds / self.inferences if self.inferences else None,
+                "detections": len(self._detections),
+                "detections_age": time.time() - self._detections_frame_time
+                if self._detections_frame_time else None,
+                "last_result_latency": self.result_latency,
+                "motion_gate": self.motion_gate.stats(
+                    self.inference_seconds / self.inferences if self.inferences else None)
+                if self.motion_gate is not None else None,
+            }
+
+
+_detectors = {}
+_detectors_lock = threading.Lock()
+
+
+def get_live_detector(stream, submit, detect_fn=None, classify_fn=None, motion_gate=None):
+    """The LiveDetector of a camera stream, created on first use."""
+    with _detectors_lock:
+        detector = _detectors.get(stream.name)
+        if detector is None:
+            detector = _detectors[stream.name] = LiveDetector(stream, submit, detect_fn, classify_fn, motion_gate)
+        return detector
+
+
+def find_live_detector(name):
+    """The LiveDetector of a camera if one was created, without creating it."""
+    with _detectors_lock:
+        return _detectors.get(name)
+
+
+def get_live_detection_stats():
+    with _detectors_lock:
+        detectors = list(_detectors.values())
+    return {detector.stream.name: detector.stats() for detector in detectors}
@@ -0,0 +1,256 @@
+"""
+Process-wide registry for the models used by the inference pipeline.
+
+Each model is loaded once per process, warmed up with a dummy input and then
+shared by every caller of get_model(). Load time and memory for every model
+are recorded and can be read back with get_model_stats().
+
+Loading and warming up are separate steps, so a pre-forking server can load
+weights in its master without running them there (see serve.py).
+"""
+
+import os
+import time
+import threading
+
+import numpy as np
+
+# Paths to the trained models. The classifier may be trained at any input
+# resolution (see sweep_classifier_resolution.py); its input size is read
+# from the model itself.
+YOLO_MODEL_PATH = r"C:\Users\User\Desktop\Noa Project\yolov8n_taco.pt"
+TRASH_CLASSIFIER_PATH = os.environ.get(
+    "TRASH_CLASSIFIER_PATH", r"C:\Users\User\Desktop\Noa Project\trash_classifier_taco_cropped.h5")
+
+# ONNX exports of the same models, written next to them by export_onnx.py
+YOLO_ONNX_PATH = os.path.splitext(YOLO_MODEL_PATH)[0] + ".onnx"
+TRASH_CLASSIFIER_ONNX_PATH = os.path.splitext(TRASH_CLASSIFIER_PATH)[0] + ".onnx"
+
+# TFLite conversions of the classifier, written by convert_classifier_tflite.py
+TFLITE_CLASSIFIER_PATHS = {
+    "float16": os.path.splitext(TRASH_CLASSIFIER_PATH)[0] + "_float16.tflite",
+    "int8": os.path.splitext(TRASH_CLASSIFIER_PATH)[0] + "_int8.tflite",
+}
+# Classification head on YOLO neck features, written by train_roi_head.py
+ROI_HEAD_PATH = os.path.join(os.path.dirname(YOLO_MODEL_PATH), "roi_head_taco.pt")
+
+# Which TFLite model to serve and how many CPU threads the interpreter may use
+TFLITE_CLASSIFIER_VARIANT = os.environ.get("TFLITE_CLASSIFIER_VARIANT", "int8")
+TFLITE_NUM_THREADS = int(os.environ.get("TFLITE_NUM_THREADS", os.cpu_count() or 1))
+
+# Size of the dummy frame used to warm up the detector (height, width)
+WARMUP_FRAME_SHAPE = (480, 640, 3)
+
+_models = {}
+_model_stats = {}
+# Names of the loaded models that have been run once
+_warmed_up = set()
+# Re-entrant, because some loaders build on other registered models
+_lock = threading.RLock()
+
+
+def process_rss_mb():
+    """Resident memory of this process in MB, or None if psutil is missing."""
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process(os.getpid()).memory_info().rss / (1024 * 1024)
+
+
+def _load_yolo():
+    from ultralytics import YOLO
+
+    return YOLO(YOLO_MODEL_PATH)
+
+
+def _warm_up_yolo(model):
+    # The first predict call builds the predictor and fuses layers
+    dummy = np.zeros(WARMUP_FRAME_SHAPE, dtype=np.uint8)
+    model.predict(source=dummy, conf=0.25, verbose=False)
+
+
+def _load_trash_classifier():
+    from keras.models import load_model
+
+    # The model is only used for inference, so no optimizer is needed
+    return load_model(TRASH_CLASSIFIER_PATH, compile=False)
+
+
+def _warm_up_trash_classifier(model):
+    height, width = model.input_shape[1:3]
+    model.predict(np.zeros((1, height, width, 3), dtype="float32"), verbose=0)
+
+
+def _load_yolo_onnx():
+    from onnx_backend import OnnxYoloDetector
+
+    return OnnxYoloDetector(YOLO_ONNX_PATH)
+
+
+def _warm_up_yolo_onnx(detector):
+    detector.predict([np.zeros(WARMUP_FRAME_SHAPE, dtype=np.uint8)])
+
+
+def _load_trash_classifier_onnx():
+    from onnx_backend import OnnxClassifier
+
+    return OnnxClassifier(TRASH_CLASSIFIER_ONNX_PATH)
+
+
+def _warm_up_classifier(classifier):
+    # ONNX and TFLite classifiers
+    size = classifier.input_size
+    classifier.predict(np.zeros((1, size, size, 3), dtype="float32"))
+
+
+def _load_trash_classifier_tflite():
+    from tflite_backend import TFLiteClassifier
+
+    return TFLiteClassifier(TFLITE_CLASSIFIER_PATHS[TFLITE_CLASSIFIER_VARIANT],
+                            num_threads=TFLITE_NUM_THREADS)
+
+
+def _load_roi_head():
+    from roi_feature_head import RoiHeadClassifier
+
+    # Shares the YOLO model of the "yolo" entry and hooks into its neck
+    return RoiHeadClassifier(get_model("yolo", warm_up=False), ROI_HEAD_PATH)
+
+
+def _warm_up_roi_head(classifier):
+    dummy = np.zeros(WARMUP_FRAME_SHAPE, dtype=np.uint8)
+    _, features, input_hw = classifier.extractor.predict([dummy])
+    classifier.classify(features, [np.array([[0, 0, 64, 64]], dtype=np.float32)], [dummy.shape], input_hw)
+
+
+# Name -> function that loads the model.
+# Framework imports happen inside the loaders, so only the frameworks of the
+# models actually used are imported.
+MODEL_LOADERS = {
+    "yolo": _load_yolo,
+    "trash_classifier": _load_trash_classifier,
+    "yolo_onnx": _load_yolo_onnx,
+    "trash_classifier_onnx": _load_trash_classifier_onnx,
+    "trash_classifier_tflite": _load_trash_classifier_tflite,
+    "roi_head": _load_roi_head,
+}
+
+# Name -> function that runs the loaded model once on a dummy input
+MODEL_WARMUPS = {
+    "yolo": _warm_up_yolo,
+    "trash_classifier": _warm_up_trash_classifier,
+    "yolo_onnx": _warm_up_yolo_onnx,
+    "trash_classifier_onnx": _warm_up_classifier,
+    "trash_classifier_tflite": _warm_up_classifier,
+    "roi_head": _warm_up_roi_head,
+}
+
+# Models whose weights may be loaded before a fork and used in the child, as long
+# as they did not run in the parent. TensorFlow (Keras, TFLite) and ONNX Runtime
+# start thread pools when a model is created, which a forked child does not get.
+FORK_SAFE_MODELS = ("yolo", "roi_head")
+
+
+def model_paths():
+    """Name -> file the model is loaded from."""
+    return {
+        "yolo": YOLO_MODEL_PATH,
+        "trash_classifier": TRASH_CLASSIFIER_PATH,
+        "yolo_onnx": YOLO_ONNX_PATH,
+        "trash_classifier_onnx": TRASH_CLASSIFIER_ONNX_PATH,
+        "trash_classifier_tflite": TFLITE_CLASSIFIER_PATHS[TFLITE_CLASSIFIER_VARIANT],
+        "roi_head": ROI_HEAD_PATH,
+    }
+
+
+def model_file_signature(name):
+    """Path, size and modification time of a model's file; changes whenever the file is replaced."""
+    path = model_paths()[name]
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path
+    return f"{path}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def loaded_model_signature(name):
+    """
+    File signature of a model as it was when this process loaded it, so it only
+    changes when the model in memory does. For a model not loaded in this process
+    (e.g. served by inference worker processes), the signature of the current file.
+    """
+    stats = _model_stats.get(name)
+    if stats is not None:
+        return stats["file_signature"]
+    return model_file_signature(name)
+
+
+def _load(name):
+    if name not in MODEL_LOADERS:
+        raise KeyError(f"Unknown model: {name}")
+
+    print(f"Loading model '{name}'...")
+    # Taken before loading, so a file replaced during the load is seen as a change later
+    signature = model_file_signature(name)
+    rss_before = process_rss_mb()
+    start = time.perf_counter()
+    model = MODEL_LOADERS[name]()
+    load_time = time.perf_counter() - start
+    rss_after = process_rss_mb()
+
+    memory_mb = None
+    if rss_before is not None and rss_after is not None:
+        memory_mb = rss_after - rss_before
+    _model_stats[name] = {
+        "load_time_sec": load_time,
+        "memory_mb": memory_mb,
+        "loaded_at": time.time(),
+        "warmup_time_sec": None,
+        "file_signature": signature,
+    }
+    memory_str = f"{memory_mb:+.1f} MB RSS" if memory_mb is not None else "memory unknown"
+    print(f"Model '{name}' loaded in {load_time:.2f}s ({memory_str})")
+    return model
+
+
+def _warm_up(name, model):
+    start = time.perf_counter()
+    MODEL_WARMUPS[name](model)
+    _model_stats[name]["warmup_time_sec"] = time.perf_counter() - start
+    _warmed_up.add(name)
+    print(f"Model '{name}' warmed up in {_model_stats[name]['warmup_time_sec']:.2f}s")
+
+
+def get_model(name, warm_up=True):
+    """Return the shared instance of a model, loading (and unless warm_up=False, warming it up) on first use."""
+    model = _models.get(name)
+    if model is not None and (name in _warmed_up or not warm_up):
+        return model
+    with _lock:
+        # Another thread may have loaded it while we were waiting for the lock
+        if name not in _models:
+            _models[name] = _load(name)
+        if warm_up and name not in _warmed_up:
+            _warm_up(name, _models[name])
+        return _models[name]
+
+
+def get_yolo_model():
+    return get_model("yolo")
+
+
+def get_trash_model():
+    return get_model("trash_classifier")
+
+
+def load_all_models(names=None, warm_up=True):
+    """Load (and warm up) the given models, or all known models, up front."""
+    for name in MODEL_LOADERS if names is None else names:
+        get_model(name, warm_up=warm_up)
+
+
+def get_model_stats():
+    """Load time (seconds) and memory (MB of RSS growth) for each loaded model."""
+    # No lock: /stats should answer even while a model is loading
+    return {name: dict(stats) for name, stats in list(_model_stats.items())}
@@ -0,0 +1,104 @@
+"""
+Motion / scene-change gate in front of the live inference.
+
+Each frame is shrunk to a small grayscale thumbnail and compared with the
+thumbnail of the last frame that went through the pipeline. If the share of
+pixels that changed noticeably stays below a threshold, the scene is taken
+as unchanged and the previous detections are reused. Comparing with the last
+inferred frame rather than the previous one means slow changes still add up
+and eventually open the gate.
+
+Regions can limit what counts as a change: only the 'include' rectangles
+(e.g. the belt) are looked at, and 'exclude' rectangles (e.g. a clock or a
+moving machine part) are ignored. Rectangles are x1, y1, x2, y2 fractions of
+the frame size.
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+# Size of the thumbnails that are compared
+THUMBNAIL_SIZE = (80, 60)
+# A thumbnail pixel counts as changed when its gray level moved by more than this
+PIXEL_THRESHOLD = 15
+
+
+def region_mask(include=None, exclude=None, size=THUMBNAIL_SIZE):
+    """Boolean thumbnail mask of the pixels the gate looks at, or None for the whole frame."""
+    if not include and not exclude:
+        return None
+    width, height = size
+    mask = np.zeros((height, width), dtype=bool) if include else np.ones((height, width), dtype=bool)
+
+    def pixels(region):
+        x1, y1, x2, y2 = region
+        return (slice(int(round(y1 * height)), int(round(y2 * height))),
+                slice(int(round(x1 * width)), int(round(x2 * width))))
+
+    for region in include or []:
+        mask[pixels(region)] = True
+    for region in exclude or []:
+        mask[pixels(region)] = False
+    return mask
+
+
+class MotionGate:
+    """Decides per frame whether the scene changed enough to run inference again."""
+
+    def __init__(self, threshold=0.01, include=None, exclude=None, max_age=10.0):
+        # Share of the (masked) pixels that must change; 0 disables the gate
+        self.threshold = threshold
+        self.mask = region_mask(include, exclude)
+        # Run inference at least this often (seconds), even on a static scene
+        self.max_age = max_age
+        self._reference = None
+        self._reference_time = None
+        self.checks = 0
+        self.hits = 0
+        self.gate_seconds = 0.0
+        self.last_change = None
+
+    def _thumbnail(self, frame_bgr):
+        small = cv2.resize(frame_bgr, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        # Smooth out sensor noise and JPEG artefacts of the network stream
+        return cv2.GaussianBlur(gray, (3, 3), 0)
+
+    def unchanged(self, frame_bgr):
+        """True if the frame can reuse the last detections. Otherwise it becomes the new reference."""
+        if self.threshold <= 0:
+            return False
+        start = time.perf_counter()
+        thumbnail = self._thumbnail(frame_bgr)
+        changed = cv2.absdiff(thumbnail, self._reference) > PIXEL_THRESHOLD \
+            if self._reference is not None else None
+        if changed is not None:
+            self.last_change = float(changed[self.mask].mean() if self.mask is not None else changed.mean())
+        is_static = changed is not None and self.last_change < self.threshold and \
+            time.time() - self._reference_time < self.max_age
+        if not is_static:
+            self._reference = thumbnail
+            self._reference_time = time.time()
+        self.checks += 1
+        self.hits += int(is_static)
+        self.gate_seconds += time.perf_counter() - start
+        return is_static
+
+    def reset(self):
+        self._reference = None
+
+    def stats(self, seconds_per_inference=None):
+        """Counters; with the average seconds of an inference, also an estimate of the time saved."""
+        stats = {
+            "threshold": self.threshold,
+            "checks": self.checks,
+            "skipped": self.hits,
+            "hit_rate": self.hits / self.checks if self.checks else None,
+            "avg_gate_ms": 1000 * self.gate_seconds / self.checks if self.checks else None,
+            "last_change": self.last_change,
+        }
+        if seconds_per_inference is not None:
+            stats["seconds_saved"] = max(self.hits * seconds_per_inference - self.gate_seconds, 0.0)
+        return stats
@@ -0,0 +1,132 @@
+"""
+ONNX Runtime versions of the YOLO detector and the trash classifier.
+
+Both models are run through onnxruntime, so a serving process using this
+backend needs neither PyTorch/ultralytics nor TensorFlow/Keras. The ONNX files
+are produced by export_onnx.py. Pre- and post-processing of the detector
+follow ultralytics (letterbox with gray padding, per-class NMS) so the boxes
+match the .pt model.
+"""
+
+import os
+
+import numpy as np
+import cv2
+
+# Execution providers passed to onnxruntime, in order of preference
+ONNX_PROVIDERS = os.environ.get("ONNX_PROVIDERS", "CPUExecutionProvider").split(",")
+
+
+def _create_session(model_path):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(model_path, sess_options=options, providers=ONNX_PROVIDERS)
+
+
+class OnnxYoloDetector:
+    """YOLOv8 detector exported with `yolo export format=onnx dynamic=True`."""
+
+    def __init__(self, model_path, imgsz=640, iou=0.7, max_det=300, stride=32):
+        self.session = _create_session(model_path)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # A dynamic export accepts rectangular inputs, like the .pt model does
+        self.dynamic = not isinstance(model_input.shape[2], int)
+        self.imgsz = imgsz
+        self.iou = iou
+        self.max_det = max_det
+        self.stride = stride
+
+    def _letterbox(self, image_bgr, auto):
+        """Same resize and padding as ultralytics' LetterBox."""
+        h, w = image_bgr.shape[:2]
+        gain = min(self.imgsz / h, self.imgsz / w)
+        new_w, new_h = int(round(w * gain)), int(round(h * gain))
+        dw = self.imgsz - new_w
+        dh = self.imgsz - new_h
+        if auto:
+            # Minimal padding up to a multiple of the stride
+            dw, dh = dw % self.stride, dh % self.stride
+        dw /= 2
+        dh /= 2
+
+        if (w, h) != (new_w, new_h):
+            image_bgr = cv2.resize(image_bgr, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+        left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+        padded = cv2.copyMakeBorder(image_bgr, top, bottom, left, right,
+                                    cv2.BORDER_CONSTANT, value=(114, 114, 114))
+        return padded, gain, (left, top)
+
+    def _postprocess(self, output, gain, pad, orig_shape, conf):
+        # output: (4 + num_classes, num_anchors) -> one row per anchor
+        predictions = output.T
+        class_scores = predictions[:, 4:]
+        class_ids = np.argmax(class_scores, axis=1)
+        scores = class_scores[np.arange(len(class_ids)), class_ids]
+        keep = scores >= conf
+        if not np.any(keep):
+            return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+        xywh = predictions[keep, :4]
+        scores = scores[keep]
+        class_ids = class_ids[keep]
+
+        # Center format -> top-left format for OpenCV's NMS
+        nms_boxes = xywh.copy()
+        nms_boxes[:, :2] -= nms_boxes[:, 2:] / 2
+        indices = cv2.dnn.NMSBoxesBatched(nms_boxes.tolist(), scores.tolist(), class_ids.tolist(),
+                                          conf, self.iou)
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        indices = indices[np.argsort(-scores[indices])][:self.max_det]
+
+        boxes = np.empty((len(indices), 4), dtype=np.float32)
+        boxes[:, :2] = nms_boxes[indices, :2]
+        boxes[:, 2:] = nms_boxes[indices, :2] + nms_boxes[indices, 2:]
+
+        # Undo the letterbox and clip to the original image
+        boxes[:, [0, 2]] -= pad[0]
+        boxes[:, [1, 3]] -= pad[1]
+        boxes /= gain
+        boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, orig_shape[1])
+        boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, orig_shape[0])
+        return boxes, scores[indices], class_ids[indices]
+
+    def predict(self, images_bgr, conf=0.25):
+        """
+        Detect objects in a list of BGR frames.
+        Returns one (xyxy boxes, confidences, class ids) tuple per frame.
+        """
+        # Like ultralytics, only use rectangular inputs when every frame has the same shape
+        auto = self.dynamic and len({image.shape for image in images_bgr}) == 1
+        batch = None
+        letterbox_info = []
+        for i, image_bgr in enumerate(images_bgr):
+            padded, gain, pad = self._letterbox(image_bgr, auto)
+            if batch is None:
+                batch = np.empty((len(images_bgr), 3) + padded.shape[:2], dtype=np.float32)
+            # BGR HWC uint8 -> RGB CHW float in [0, 1]
+            np.divide(padded[:, :, ::-1].transpose(2, 0, 1), np.float32(255.0), out=batch[i],
+                      dtype=np.float32)
+            letterbox_info.append((gain, pad, image_bgr.shape[:2]))
+
+        outputs = self.session.run(None, {self.input_name: batch})[0]
+        return [self._postprocess(output, gain, pad, orig_shape, conf)
+                for output, (gain, pad, orig_shape) in zip(outputs, letterbox_info)]
+
+
+class OnnxClassifier:
+    """The Keras trash classifier exported to ONNX (NHWC float input in [0, 1])."""
+
+    def __init__(self, model_path):
+        self.session = _create_session(model_path)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # (batch, height, width, channels)
+        self.input_size = int(model_input.shape[1])
+
+    def predict(self, batch):
+        """Class probabilities for a (N, H, W, 3) float32 batch."""
+        return self.session.run(None, {self.input_name: np.ascontiguousarray(batch, dtype=np.float32)})[0]
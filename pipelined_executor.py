@@ -0,0 +1,153 @@
+"""
+Two-stage pipelined execution of the inference pipeline.
+
+predict_frame runs YOLO and then the crop classifier on the same frame, so
+each model sits idle while the other one works. Here the detector stage and
+the classifier stage each get their own worker thread, connected by a
+bounded queue: while the classifier handles the crops of frame N the
+detector already runs on frame N+1, and with enough frames in flight the
+throughput approaches that of the slower stage instead of the sum of both.
+Both frameworks release the GIL while a model runs, so the stages overlap
+within one process. detect_frame and classify_detections go through the same
+stage threads, so each model is only ever called from its own stage.
+
+Each stage records its busy time (occupancy) and the time it stalled, either
+starved (waiting for input) or blocked (waiting for room in the next queue),
+which shows which stage limits the throughput.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class _StageStats:
+    def __init__(self):
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.starved_seconds = 0.0
+        self.blocked_seconds = 0.0
+
+    def stats(self, elapsed):
+        return {
+            "items": self.items,
+            "occupancy": self.busy_seconds / elapsed if elapsed > 0 else None,
+            "avg_ms": 1000 * self.busy_seconds / self.items if self.items else None,
+            "starved_seconds": self.starved_seconds,
+            "blocked_seconds": self.blocked_seconds,
+        }
+
+
+class PipelinedExecutor:
+    """
+    Runs detect_fn(image_rgb) and classify_fn(image_rgb, detections) on
+    separate worker threads. submit() returns a Future of the frame's final
+    detections, so it can stand in for predict_frame.
+    """
+
+    def __init__(self, detect_fn, classify_fn, queue_size=2):
+        self.detect_fn = detect_fn
+        self.classify_fn = classify_fn
+        self.queue_size = queue_size
+        self._input = queue.Queue(maxsize=queue_size)
+        self._detected = queue.Queue(maxsize=queue_size)
+        self._stats = {"detect": _StageStats(), "classify": _StageStats()}
+        self._lock = threading.Lock()
+        self._started_at = time.perf_counter()
+        self.submit_blocked_seconds = 0.0
+        self._stages_pid = None
+
+    def _start_stages(self):
+        # Like InferencePool, the stage threads start on first use and again after a fork
+        with self._lock:
+            if self._stages_pid == os.getpid():
+                return
+            self._stages_pid = os.getpid()
+        for name, target in (("detect", self._detect_stage), ("classify", self._classify_stage)):
+            threading.Thread(target=target, name=f"pipeline-{name}", daemon=True).start()
+
+    def submit(self, image_rgb, detections=None, classify=True):
+        """
+        Queue a frame for the pipeline. Blocks while the detector stage's queue
+        is full. Given detections skip the detector stage; with classify=False
+        the classifier stage passes the detections through.
+        """
+        self._start_stages()
+        future = Future()
+        start = time.perf_counter()
+        self._input.put((future, image_rgb, detections, classify))
+        with self._lock:
+            self.submit_blocked_seconds += time.perf_counter() - start
+        return future
+
+    def predict_frame(self, image_rgb):
+        return self.submit(image_rgb).result()
+
+    def detect_frame(self, image_rgb):
+        return self.submit(image_rgb, classify=False).result()
+
+    def classify_detections(self, image_rgb, detections):
+        return self.submit(image_rgb, detections=detections).result()
+
+    def predict_frames(self, images_rgb):
+        """All frames go into the pipeline before the first result is awaited, so the stages overlap."""
+        futures = [self.submit(image) for image in images_rgb]
+        return [future.result() for future in futures]
+
+    def _get(self, source, stage):
+        start = time.perf_counter()
+        item = source.get()
+        with self._lock:
+            stage.starved_seconds += time.perf_counter() - start
+        return item
+
+    def _run(self, stage, fn, *args):
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            with self._lock:
+                stage.busy_seconds += time.perf_counter() - start
+                stage.items += 1
+
+    def _detect_stage(self):
+        stage = self._stats["detect"]
+        while True:
+            future, image_rgb, detections, classify = self._get(self._input, stage)
+            if not future.set_running_or_notify_cancel():
+                continue
+            if detections is None:
+                try:
+                    detections = self._run(stage, self.detect_fn, image_rgb)
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
+            start = time.perf_counter()
+            self._detected.put((future, image_rgb, detections, classify))
+            with self._lock:
+                stage.blocked_seconds += time.perf_counter() - start
+
+    def _classify_stage(self):
+        stage = self._stats["classify"]
+        while True:
+            future, image_rgb, detections, classify = self._get(self._detected, stage)
+            if not classify:
+                future.set_result(detections)
+                continue
+            try:
+                future.set_result(self._run(stage, self.classify_fn, image_rgb, detections))
+            except Exception as e:
+                future.set_exception(e)
+
+    def stats(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self._started_at
+            return {
+                "queue_size": self.queue_size,
+                "input_queued": self._input.qsize(),
+                "between_stages_queued": self._detected.qsize(),
+                "submit_blocked_seconds": self.submit_blocked_seconds,
+                "stages": {name: stage.stats(elapsed) for name, stage in self._stats.items()},
+            }
@@ -11,15 +11,17 @@ TACO_DATA_PATH = r"C:\Users\User\Desktop\Noa Project\Taco\TACO-master\data"
 ANNOTATIONS_FILE = os.path.join(TACO_DATA_PATH, "annotations.json")
 OUTPUT_DATASET_DIR = os.path.join(TACO_DATA_PATH, "TacoCropped")
 
+# Side length of the saved (letterboxed) crops
+CROP_SIZE = 128
+
 # Categories for TrashNet
 TRASHNET_CATEGORIES = ["plastic", "metal", "paper", "glass", "cardboard", "trash"]
 
-# Create directories for each category if they don't exist
-for cat in TRASHNET_CATEGORIES:
-    os.makedirs(os.path.join(OUTPUT_DATASET_DIR, cat), exist_ok=True)
-
-# Dictionary to count the number of images per category
-category_counts = defaultdict(int)
+def dataset_dir_for_size(crop_size):
+    """TacoCropped for the default size, TacoCropped_<size> for other sizes."""
+    if crop_size == CROP_SIZE:
+        return OUTPUT_DATASET_DIR
+    return os.path.join(TACO_DATA_PATH, f"TacoCropped_{crop_size}")
 
 # Function to map category names
 def map_category_to_trashnet(name: str, supercat: str):
@@ -130,7 +132,7 @@ def resize_keep_aspect(img, desired_size=224):
     return new_img
 
 # Function to ensure each category has exactly 250 images
-def ensure_250_images_per_category(dataset_dir, target_size=250):
+def ensure_250_images_per_category(dataset_dir, category_counts, target_size=250):
     for category in TRASHNET_CATEGORIES:
         cat_dir = os.path.join(dataset_dir, category)
         images = os.listdir(cat_dir)
@@ -152,82 +154,115 @@ def ensure_250_images_per_category(dataset_dir, target_size=250):
         category_counts[category] = len(images)
 
 # Load the annotations file
-with open(ANNOTATIONS_FILE, "r", encoding="utf-8") as f:
-    data = json.load(f)
-
-images_info = data.get("images", [])
-annotations_info = data.get("annotations", [])
-categories_info = data.get("categories", [])
-
-# Build category details and image-to-objects mapping
-cat_id_to_details = {}
-for cat in categories_info:
-    cat_id = cat["id"]
-    cat_name = cat["name"]
-    cat_super = cat["supercategory"]
-    cat_id_to_details[cat_id] = (cat_name, cat_super)
-
-image_id_to_objects = defaultdict(list)
-for ann in annotations_info:
-    image_id = ann["image_id"]
-    cat_id = ann["category_id"]
-    bbox = ann["bbox"]
-    image_id_to_objects[image_id].append((cat_id, bbox))
-
-print("Processing TACO images and extracting cropped objects...")
-
-# Process images
-count_total = 0
-count_saved = 0
-
-for img_info in images_info:
-    image_id = img_info["id"]
-    file_name = img_info["file_name"]
-    img_path = os.path.join(TACO_DATA_PATH, file_name)
-    if not os.path.exists(img_path):
-        continue
-    img = cv2.imread(img_path)
-    if img is None:
-        continue
-
-    annotations = image_id_to_objects.get(image_id, [])
-    for i, (cat_id, bbox) in enumerate(annotations):
-        count_total += 1
-        x, y, w, h = bbox
-        x1 = int(x)
-        y1 = int(y)
-        x2 = int(x + w)
-        y2 = int(y + h)
-        if x2 <= x1 or y2 <= y1:
+def load_annotations(annotations_file=ANNOTATIONS_FILE):
+    """
+    Returns the image list, a category id -> (name, supercategory) mapping
+    and an image id -> [(category id, bbox)] mapping.
+    """
+    with open(annotations_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    images_info = data.get("images", [])
+    annotations_info = data.get("annotations", [])
+    categories_info = data.get("categories", [])
+
+    # Build category details and image-to-objects mapping
+    cat_id_to_details = {}
+    for cat in categories_info:
+        cat_id = cat["id"]
+        cat_name = cat["name"]
+        cat_super = cat["supercategory"]
+        cat_id_to_details[cat_id] = (cat_name, cat_super)
+
+    image_id_to_objects = defaultdict(list)
+    for ann in annotations_info:
+        image_id = ann["image_id"]
+        cat_id = ann["category_id"]
+        bbox = ann["bbox"]
+        image_id_to_objects[image_id].append((cat_id, bbox))
+
+    return images_info, cat_id_to_details, image_id_to_objects
+
+def prepare_dataset(crop_size=CROP_SIZE, output_dir=None):
+    """
+    Cut every annotated object out of the TACO images, letterbox it to
+    crop_size x crop_size and save it under output_dir/<category>.
+    Returns the number of crops per category.
+    """
+    if output_dir is None:
+        output_dir = dataset_dir_for_size(crop_size)
+
+    # Create directories for each category if they don't exist
+    for cat in TRASHNET_CATEGORIES:
+        os.makedirs(os.path.join(output_dir, cat), exist_ok=True)
+
+    # Dictionary to count the number of images per category
+    category_counts = defaultdict(int)
+
+    images_info, cat_id_to_details, image_id_to_objects = load_annotations()
+
+    print("Processing TACO images and extracting cropped objects...")
+
+    # Process images
+    count_total = 0
+    count_saved = 0
+
+    for img_info in images_info:
+        image_id = img_info["id"]
+        file_name = img_info["file_name"]
+        img_path = os.path.join(TACO_DATA_PATH, file_name)
+        if not os.path.exists(img_path):
             continue
-        crop = img[y1:y2, x1:x2]
-        if crop.size == 0:
+        img = cv2.imread(img_path)
+        if img is None:
             continue
-        crop_processed = resize_keep_aspect(crop, desired_size=128)
+
+        annotations = image_id_to_objects.get(image_id, [])
+        for i, (cat_id, bbox) in enumerate(annotations):
+            count_total += 1
+            x, y, w, h = bbox
+            x1 = int(x)
+            y1 = int(y)
+            x2 = int(x + w)
+            y2 = int(y + h)
+            if x2 <= x1 or y2 <= y1:
+                continue
+            crop = img[y1:y2, x1:x2]
+            if crop.size == 0:
+                continue
+            crop_processed = resize_keep_aspect(crop, desired_size=crop_size)
         
-        cat_name, cat_super = cat_id_to_details.get(cat_id, ("", ""))
-        trashnet_cat = map_category_to_trashnet(cat_name, cat_super)
+            cat_name, cat_super = cat_id_to_details.get(cat_id, ("", ""))
+            trashnet_cat = map_category_to_trashnet(cat_name, cat_super)
         
-        category_counts[trashnet_cat] += 1
+            category_counts[trashnet_cat] += 1
         
-        out_dir = os.path.join(OUTPUT_DATASET_DIR, trashnet_cat)
-        os.makedirs(out_dir, exist_ok=True)
-        out_filename = f"{image_id}_{i}.jpg"
-        out_path = os.path.join(out_dir, out_filename)
-        cv2.imwrite(out_path, crop_processed)
-        count_saved += 1
-
-print(f"Processed {len(images_info)} images, extracted {count_total} objects, saved {count_saved} cropped images.")
-
-# Ensure each category has 250 images
-ensure_250_images_per_category(OUTPUT_DATASET_DIR)
-
-# Plot the cropped images per category
-categories = list(category_counts.keys())
-counts = list(category_counts.values())
-plt.figure(figsize=(8, 6))
-plt.bar(categories, counts, color='skyblue')
-plt.xlabel("Category")
-plt.ylabel("Number of Cropped Images")
-plt.title("Cropped Images per Category")
-plt.show()
+            out_dir = os.path.join(output_dir, trashnet_cat)
+            os.makedirs(out_dir, exist_ok=True)
+            out_filename = f"{image_id}_{i}.jpg"
+            out_path = os.path.join(out_dir, out_filename)
+            cv2.imwrite(out_path, crop_processed)
+            count_saved += 1
+
+    print(f"Processed {len(images_info)} images, extracted {count_total} objects, saved {count_saved} cropped images.")
+
+    # Ensure each category has 250 images
+    ensure_250_images_per_category(output_dir, category_counts)
+
+    return category_counts
+
+def main():
+    category_counts = prepare_dataset(CROP_SIZE)
+
+    # Plot the cropped images per category
+    categories = list(category_counts.keys())
+    counts = list(category_counts.values())
+    plt.figure(figsize=(8, 6))
+    plt.bar(categories, counts, color='skyblue')
+    plt.xlabel("Category")
+    plt.ylabel("Number of Cropped Images")
+    plt.title("Cropped Images per Category")
+    plt.show()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Multi-process inference workers with shared-memory frame hand-off.
+
+Each worker process loads its own copy of the models (see
+inference_pipeline_update.preload_models), so YOLO, Keras and OpenCV run in
+parallel without contending for one interpreter's GIL or one framework
+thread pool. Frames are not pickled to the workers: the parent copies each
+frame into a free slot of a shared-memory ring and only sends the slot
+number, shape and dtype; results come back as the usual small detection
+lists. Frames that do not fit in a slot fall back to being pickled.
+
+Every worker talks to the parent over its own pipe. When a worker dies the
+parent notices at once (the pipe closes), restarts it after a short backoff
+and re-dispatches the jobs it was holding, once, to the other workers.
+"""
+
+import atexit
+import itertools
+import multiprocessing as mp
+import os
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Pipeline functions the workers run, and whether they take a list of frames
+REMOTE_FUNCTIONS = {
+    "predict_frame": False,
+    "predict_frames": True,
+    "detect_frame": False,
+    "classify_detections": False,
+}
+# Default slot size: one 1280x720 BGR/RGB frame
+SLOT_BYTES = 1280 * 720 * 3
+# A job whose worker crashed is re-dispatched this many times before it fails
+MAX_JOB_RETRIES = 1
+# Restart delay after a crash: RESTART_BASE_DELAY * 2**consecutive crashes, capped
+RESTART_BASE_DELAY = 0.5
+RESTART_MAX_DELAY = 30.0
+
+
+def _attach_shared_memory(name):
+    try:
+        # Python 3.13+: the parent alone owns (and unlinks) the block
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Older versions register it again with the parent's resource tracker, which is harmless
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker_main(shm_name, slot_bytes, conn):
+    """Entry point of a worker process: load the models, then serve jobs from the pipe."""
+    start = time.perf_counter()
+    import inference_pipeline_update as pipeline
+    pipeline.preload_models()
+    shm = _attach_shared_memory(shm_name)
+    functions = {name: getattr(pipeline, name) for name in REMOTE_FUNCTIONS}
+    conn.send(("ready", os.getpid(), time.perf_counter() - start))
+
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            job_id, fn_name, frames, kwargs = message
+            try:
+                images = [np.ndarray(frame[1], dtype=frame[2], buffer=shm.buf, offset=frame[3] * slot_bytes)
+                          if frame[0] == "shm" else frame[1] for frame in frames]
+                argument = images if REMOTE_FUNCTIONS[fn_name] else images[0]
+                conn.send(("result", job_id, True, functions[fn_name](argument, **kwargs)))
+                # The views must not outlive the job, or the block cannot be closed
+                del images, argument
+            except Exception as e:
+                conn.send(("result", job_id, False, f"{type(e).__name__}: {e}"))
+    finally:
+        shm.close()
+
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+class _Job:
+    def __init__(self, job_id, fn_name, frames, kwargs):
+        self.id = job_id
+        self.fn_name = fn_name
+        self.frames = frames
+        self.kwargs = kwargs
+        self.future = Future()
+        self.retries = 0
+
+
+class _Worker:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.send_lock = threading.Lock()
+        self.in_flight = {}
+        self.alive = False
+        self.ready = False
+        self.pid = None
+        self.startup_seconds = None
+        self.jobs_done = 0
+        self.restarts = 0
+        self.consecutive_crashes = 0
+
+
+class ProcessInferencePool:
+    """A fixed number of inference worker processes sharing a ring of frame slots."""
+
+    def __init__(self, num_workers, num_slots=16, slot_bytes=SLOT_BYTES):
+        self.num_workers = num_workers
+        self.num_slots = num_slots
+        self.slot_bytes = slot_bytes
+        self._ctx = mp.get_context("spawn")
+        self._shm = None
+        self._workers = []
+        self._lock = threading.Condition()
+        self._free_slots = list(range(num_slots))
+        self._job_ids = itertools.count(1)
+        self._started = False
+        self._closing = False
+        self.inline_frames = 0
+
+    def start(self):
+        """Create the shared memory and start the workers. Called on first use."""
+        with self._lock:
+            if self._started:
+                return self
+            self._started = True
+            self._shm = shared_memory.SharedMemory(create=True, size=self.num_slots * self.slot_bytes)
+            self._workers = [_Worker(i) for i in range(self.num_workers)]
+        atexit.register(self.close)
+        for worker in self._workers:
+            self._spawn(worker)
+        return self
+
+    def _spawn(self, worker):
+        parent_conn, child_conn = self._ctx.Pipe()
+        process = self._ctx.Process(target=_worker_main, args=(self._shm.name, self.slot_bytes, child_conn),
+                                    name=f"inference-worker-{worker.index}", daemon=True)
+        process.start()
+        child_conn.close()
+        with self._lock:
+            worker.process, worker.conn = process, parent_conn
+            worker.alive, worker.ready, worker.pid = True, False, process.pid
+            self._lock.notify_all()
+        threading.Thread(target=self._receive, args=(worker,), name=f"inference-worker-{worker.index}-results",
+                         daemon=True).start()
+
+    def _receive(self, worker):
+        while True:
+            try:
+                message = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == "ready":
+                _, pid, seconds = message
+                print(f"Inference worker {worker.index} (pid {pid}) ready in {seconds:.1f}s")
+                with self._lock:
+                    worker.ready, worker.startup_seconds = True, seconds
+                continue
+            _, job_id, ok, value = message
+            with self._lock:
+                job = worker.in_flight.pop(job_id, None)
+                worker.jobs_done += 1
+                worker.consecutive_crashes = 0
+            if job is not None:
+                if ok:
+                    job.future.set_result(value)
+                else:
+                    job.future.set_exception(RuntimeError(value))
+        self._handle_exit(worker)
+
+    def _handle_exit(self, worker):
+        worker.process.join(timeout=5)
+        with self._lock:
+            worker.alive = False
+            jobs = list(worker.in_flight.values())
+            worker.in_flight.clear()
+            if self._closing:
+                return
+            worker.consecutive_crashes += 1
+            worker.restarts += 1
+            delay = min(RESTART_BASE_DELAY * 2 ** (worker.consecutive_crashes - 1), RESTART_MAX_DELAY)
+        print(f"Inference worker {worker.index} exited with code {worker.process.exitcode}, "
+              f"restarting in {delay:.1f}s")
+
+        # The jobs it held go to the other workers (or to this one once it is back)
+        for job in jobs:
+            if job.retries < MAX_JOB_RETRIES:
+                job.retries += 1
+                threading.Thread(target=self._dispatch, args=(job,), daemon=True).start()
+            else:
+                job.future.set_exception(WorkerCrashed(f"Inference worker {worker.index} crashed"))
+
+        time.sleep(delay)
+        worker.conn.close()
+        self._spawn(worker)
+
+    def _dispatch(self, job):
+        while True:
+            with self._lock:
+                self._lock.wait_for(lambda: any(w.alive for w in self._workers) or self._closing)
+                if self._closing:
+                    job.future.set_exception(RuntimeError("Inference pool is closed"))
+                    return
+                # Ready workers first, then the one with the fewest jobs
+                worker = min((w for w in self._workers if w.alive),
+                             key=lambda w: (not w.ready, len(w.in_flight)))
+                worker.in_flight[job.id] = job
+            try:
+                with worker.send_lock:
+                    worker.conn.send((job.id, job.fn_name, job.frames, job.kwargs))
+                return
+            except (OSError, ValueError):
+                # The worker died under us; its receiver thread restarts it, try another
+                with self._lock:
+                    worker.in_flight.pop(job.id, None)
+                    worker.alive = False
+
+    def _put_frames(self, images):
+        """
+        Frames for a job message, copying those that fit into free slots. Returns (frames, slots).
+        All slots of a job are reserved in one step, so callers never hold some slots while
+        waiting for more. Frames beyond num_slots, like frames too large for a slot, are pickled.
+        """
+        images = [np.ascontiguousarray(image) for image in images]
+        fitting = [i for i, image in enumerate(images) if image.nbytes <= self.slot_bytes][:self.num_slots]
+        with self._lock:
+            # Blocks while the ring is too full: it bounds the frames in flight
+            self._lock.wait_for(lambda: len(self._free_slots) >= len(fitting))
+            slots = [self._free_slots.pop() for _ in fitting]
+            self.inline_frames += len(images) - len(fitting)
+
+        slot_of = dict(zip(fitting, slots))
+        frames = []
+        for i, image in enumerate(images):
+            slot = slot_of.get(i)
+            if slot is None:
+                frames.append(("inline", image))
+                continue
+            np.ndarray(image.shape, dtype=image.dtype, buffer=self._shm.buf, offset=slot * self.slot_bytes)[...] = image
+            frames.append(("shm", image.shape, image.dtype.str, slot))
+        return frames, slots
+
+    def _release_slots(self, slots):
+        with self._lock:
+            self._free_slots.extend(slots)
+            self._lock.notify_all()
+
+    def call(self, fn_name, argument, timeout=None, **kwargs):
+        """Run a pipeline function (see REMOTE_FUNCTIONS) in a worker and return its result."""
+        self.start()
+        images = argument if REMOTE_FUNCTIONS[fn_name] else [argument]
+        frames, slots = self._put_frames(images)
+        job = _Job(next(self._job_ids), fn_name, frames, kwargs)
+        # The slots are freed once the job is done, not when the caller stops waiting:
+        # after a timeout a worker may still be reading them
+        job.future.add_done_callback(lambda _: self._release_slots(slots))
+        self._dispatch(job)
+        return job.future.result(timeout=timeout)
+
+    def remote(self, fn_name):
+        """A function with the signature of the pipeline function fn_name that runs it in a worker."""
+        def run(argument, **kwargs):
+            return self.call(fn_name, argument, **kwargs)
+        run.__name__ = fn_name
+        return run
+
+    def close(self):
+        with self._lock:
+            if not self._started or self._closing:
+                return
+            self._closing = True
+            self._lock.notify_all()
+        for worker in self._workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=10)
+        self._shm.close()
+        self._shm.unlink()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": [{
+                    "index": w.index,
+                    "pid": w.pid,
+                    "alive": w.alive,
+                    "ready": w.ready,
+                    "startup_seconds": w.startup_seconds,
+                    "in_flight": len(w.in_flight),
+                    "jobs_done": w.jobs_done,
+                    "restarts": w.restarts,
+                } for w in self._workers],
+                "slots": self.num_slots,
+                "free_slots": len(self._free_slots),
+                "slot_bytes": self.slot_bytes,
+                "inline_frames": self.inline_frames,
+            }
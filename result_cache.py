@@ -0,0 +1,83 @@
+"""
+Content-addressed cache of inference results.
+
+Entries are keyed by a hash of the decoded image pixels plus the version of
+the models that produced them, so the same picture is only run through the
+pipeline once, whatever its file name. Least recently used entries are
+evicted when either the entry count or the memory bound is exceeded.
+"""
+
+import copy
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+
+def image_cache_key(image, model_version):
+    """SHA-256 of the image's shape, dtype and pixels, plus the model version."""
+    digest = hashlib.sha256()
+    digest.update(f"{image.shape}|{image.dtype}|{model_version}".encode("utf-8"))
+    # hashlib reads contiguous arrays in place, without copying them
+    digest.update(image if image.flags["C_CONTIGUOUS"] else image.tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Thread-safe LRU cache of (detections, rendered result JPEG bytes)."""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(detections, image_bytes):
+        return len(image_bytes) + len(json.dumps(detections))
+
+    def get(self, key):
+        """(detections, image bytes) for key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            detections, image_bytes, _ = entry
+        # Callers get their own copy of the detections
+        return copy.deepcopy(detections), image_bytes
+
+    def put(self, key, detections, image_bytes):
+        size = self._entry_size(detections, image_bytes)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            self._entries[key] = (copy.deepcopy(detections), image_bytes, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
@@ -0,0 +1,135 @@
+"""
+Classification of detections from YOLOv8 neck features (ROI pooling).
+
+Instead of running MobileNetV2 on a pixel crop of every detection, the
+P3/P4/P5 feature maps that YOLO has already computed for the whole frame
+(the inputs of its Detect head) are pooled inside each box with RoIAlign,
+and a small head predicts the trash class. The cost per detection is a few
+small matrix products, so it barely grows with the number of objects.
+The head is trained by train_roi_head.py.
+"""
+
+import threading
+
+import numpy as np
+import torch
+from torch import nn
+from torchvision.ops import roi_align
+
+# Spatial size each box is pooled to, on every feature level
+ROI_OUTPUT_SIZE = 4
+
+
+class RoiClassificationHead(nn.Module):
+    """RoIAlign on every feature level, 1x1 channel reduction, then a small MLP."""
+
+    def __init__(self, in_channels, num_classes=6, reduced_channels=64, hidden_size=256,
+                 output_size=ROI_OUTPUT_SIZE):
+        super().__init__()
+        self.in_channels = list(in_channels)
+        self.output_size = output_size
+        self.reduce = nn.ModuleList(
+            nn.Sequential(nn.Conv2d(c, reduced_channels, 1, bias=False),
+                          nn.BatchNorm2d(reduced_channels),
+                          nn.ReLU(inplace=True))
+            for c in self.in_channels
+        )
+        self.classifier = nn.Sequential(
+            nn.Flatten(),
+            nn.Linear(len(self.in_channels) * reduced_channels * output_size ** 2, hidden_size),
+            nn.ReLU(inplace=True),
+            nn.Dropout(0.3),
+            nn.Linear(hidden_size, num_classes),
+        )
+
+    def pool(self, features, rois, strides):
+        """
+        RoIAlign of (K, 5) [batch index, x1, y1, x2, y2] rois, given in network
+        input pixels, on every feature level. Has no weights, so it can be cached.
+        """
+        return [roi_align(f.float(), rois, self.output_size, spatial_scale=1.0 / s,
+                          sampling_ratio=2, aligned=True)
+                for f, s in zip(features, strides)]
+
+    def classify_pooled(self, pooled):
+        return self.classifier(torch.cat([reduce(p) for reduce, p in zip(self.reduce, pooled)], dim=1))
+
+    def forward(self, features, rois, strides):
+        return self.classify_pooled(self.pool(features, rois, strides))
+
+
+class YoloFeatureExtractor:
+    """Runs an ultralytics YOLO model and captures the feature maps its Detect head receives."""
+
+    def __init__(self, yolo_model):
+        self.yolo = yolo_model
+        detection_model = yolo_model.model
+        self.strides = [float(s) for s in detection_model.stride]
+        # Capture state is per thread: the YOLO model is shared, and a plain predict
+        # on another thread runs through the same hook without being captured
+        self._local = threading.local()
+        detection_model.model[-1].register_forward_pre_hook(self._hook)
+
+    def _hook(self, module, inputs):
+        if getattr(self._local, "capturing", False):
+            # Detect.forward overwrites the list items, so keep our own list
+            self._local.features = [x.detach() for x in inputs[0]]
+
+    def predict(self, images_bgr, conf=0.25):
+        """YOLO results, the captured [P3, P4, P5] features and the network input (height, width)."""
+        self._local.capturing = True
+        self._local.features = None
+        try:
+            results = self.yolo.predict(source=images_bgr, conf=conf, verbose=False)
+            features = self._local.features
+        finally:
+            self._local.capturing = False
+            self._local.features = None
+        input_hw = (features[0].shape[2] * self.strides[0], features[0].shape[3] * self.strides[0])
+        return results, features, input_hw
+
+
+def boxes_to_input_coords(boxes, image_shape, input_hw):
+    """Map x1, y1, x2, y2 boxes from original image pixels to letterboxed network input pixels."""
+    h0, w0 = image_shape[:2]
+    gain = min(input_hw[0] / h0, input_hw[1] / w0)
+    # Same rounding as ultralytics' scale_boxes
+    pad_x = round((input_hw[1] - w0 * gain) / 2 - 0.1)
+    pad_y = round((input_hw[0] - h0 * gain) / 2 - 0.1)
+    mapped = np.asarray(boxes, dtype=np.float32).reshape(-1, 4) * gain
+    mapped[:, [0, 2]] += pad_x
+    mapped[:, [1, 3]] += pad_y
+    return mapped
+
+
+def build_rois(per_image_boxes, image_shapes, input_hw):
+    """(K, 5) roi tensor for boxes of several images of one YOLO batch."""
+    rois = []
+    for batch_idx, (boxes, image_shape) in enumerate(zip(per_image_boxes, image_shapes)):
+        mapped = boxes_to_input_coords(boxes, image_shape, input_hw)
+        rois.append(np.concatenate([np.full((len(mapped), 1), batch_idx, dtype=np.float32), mapped], axis=1))
+    return torch.from_numpy(np.concatenate(rois, axis=0) if rois else np.zeros((0, 5), dtype=np.float32))
+
+
+class RoiHeadClassifier:
+    """A YOLO model plus a trained ROI head; used by the pipeline's roi_head mode."""
+
+    def __init__(self, yolo_model, head_path):
+        self.extractor = YoloFeatureExtractor(yolo_model)
+        checkpoint = torch.load(head_path, map_location="cpu")
+        self.head = RoiClassificationHead(checkpoint["in_channels"], num_classes=len(checkpoint["class_names"]),
+                                          output_size=checkpoint["output_size"])
+        self.head.load_state_dict(checkpoint["state_dict"])
+        self.head.eval()
+        self.class_names = checkpoint["class_names"]
+
+    def classify(self, features, per_image_boxes, image_shapes, input_hw):
+        """Class probabilities for every box, in order, given the features of one YOLO batch."""
+        rois = build_rois(per_image_boxes, image_shapes, input_hw)
+        if len(rois) == 0:
+            return np.zeros((0, len(self.class_names)), dtype=np.float32)
+        device = features[0].device
+        self.head.to(device)
+        with torch.no_grad():
+            logits = self.head(features, rois.to(device), self.extractor.strides)
+        return torch.softmax(logits, dim=1).cpu().numpy()
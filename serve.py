@@ -0,0 +1,171 @@
+"""
+Production server for app.py: gunicorn with the models loaded once in the master.
+
+The master imports the app, loads the weights of the torch models (YOLO and
+the ROI head) without running them and only then forks SERVER_WORKERS worker
+processes, each running SERVER_THREADS threads (streams hold one thread per
+viewer). The workers inherit those weights copy-on-write instead of each
+loading their own copy. gc.freeze() before the fork keeps the garbage
+collector from touching, and thereby copying, the pages of the objects
+loaded so far.
+
+Nothing runs a model in the master: TensorFlow (the Keras and TFLite
+classifiers) and ONNX Runtime are not fork-safe once initialised, and their
+thread pools do not exist in a forked child. Those models are loaded in each
+worker, so their weights are not shared. Every worker then warms up all
+models and runs one prediction on a dummy frame before it takes requests;
+a worker whose smoke test fails exits with gunicorn's boot-error code, which
+stops the server instead of restarting the worker in a loop.
+
+Threads do not survive the fork either: the inference pool, camera readers
+and live detectors start in each worker on first use. With several workers
+every one of them would open its own connection to each camera (a local
+device or DroidCam accepts only one) and keep its own live detections and
+tracks, so /detect_feed and /tracks would answer differently per worker.
+The app always has at least one camera, so the server runs one worker
+(SERVER_WORKERS defaults to 1 and larger values are refused) and scales with
+SERVER_THREADS; for parallel inference use INFERENCE_PROCESSES.
+
+Graceful reload: `kill -HUP <master pid>` replaces the worker,
+letting running requests finish within GRACEFUL_TIMEOUT seconds; the models
+stay loaded in the master. Startup time and the memory of the master and
+every worker are logged.
+
+Gunicorn does not run on Windows; there, use `python app.py`.
+
+Usage:
+    SERVER_THREADS=32 python serve.py
+"""
+
+import gc
+import os
+import sys
+import time
+
+import numpy as np
+from gunicorn.app.base import BaseApplication
+
+from model_registry import FORK_SAFE_MODELS, WARMUP_FRAME_SHAPE, load_all_models, process_rss_mb
+
+SERVER_BIND = os.environ.get("SERVER_BIND", "0.0.0.0:5000")
+# Camera readers and live detection live in the worker, so there is only one (see above)
+SERVER_WORKERS = int(os.environ.get("SERVER_WORKERS", "1"))
+SERVER_THREADS = int(os.environ.get("SERVER_THREADS", "16"))
+# Seconds running requests get to finish on reload or shutdown
+GRACEFUL_TIMEOUT = 30
+# A worker that does not report back for this many seconds is restarted
+WORKER_TIMEOUT = 120
+SERVER_PIDFILE = os.environ.get("SERVER_PIDFILE")
+# gunicorn.arbiter.Arbiter.WORKER_BOOT_ERROR
+WORKER_BOOT_ERROR = 3
+
+_started_at = time.perf_counter()
+
+
+def _memory():
+    """RSS and, if psutil can tell, the private (unshared) part of it, for the log."""
+    rss = process_rss_mb()
+    if rss is None:
+        return "RSS unknown (psutil missing)"
+    try:
+        import psutil
+        uss = psutil.Process(os.getpid()).memory_full_info().uss / (1024 * 1024)
+        return f"RSS {rss:.0f} MB, private {uss:.0f} MB"
+    except Exception:
+        return f"RSS {rss:.0f} MB"
+
+
+def when_ready(server):
+    print(f"Server ready on {SERVER_BIND} in {time.perf_counter() - _started_at:.1f}s, "
+          f"master pid {os.getpid()}: {_memory()}")
+
+
+def pre_fork(server, worker):
+    worker.forked_at = time.perf_counter()
+
+
+def post_worker_init(worker):
+    import app as web_app
+
+    if web_app.process_pool is None:
+        try:
+            # Loads the models the master left out and warms up all of them in this process
+            web_app.preload_models()
+            detections = web_app.predict_frame(np.zeros(WARMUP_FRAME_SHAPE, dtype=np.uint8))
+            print(f"Worker {worker.pid} smoke test passed ({len(detections)} detections on a blank frame)")
+        except Exception as e:
+            print(f"Worker {worker.pid} cannot run inference: {e}")
+            # Gunicorn stops the whole server when a worker exits with this code
+            sys.exit(WORKER_BOOT_ERROR)
+    print(f"Worker {worker.pid} up in {time.perf_counter() - worker.forked_at:.2f}s: {_memory()}")
+
+
+def worker_exit(server, worker):
+    print(f"Worker {worker.pid} exiting: {_memory()}")
+
+
+def on_reload(server):
+    print("Reloading: replacing the workers, models stay loaded in the master")
+
+
+class PreforkServer(BaseApplication):
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+def main():
+    import app as web_app
+
+    if web_app.CAMERA_SOURCES and SERVER_WORKERS > 1:
+        raise ValueError(f"Each worker would open its own connection to the cameras "
+                         f"({', '.join(web_app.CAMERA_SOURCES)}) and keep its own live detections; "
+                         f"set SERVER_WORKERS=1")
+
+    web_app.ensure_templates_exist()
+    if web_app.process_pool is not None:
+        # Each server worker starts its own inference processes; the master loads nothing
+        print("INFERENCE_PROCESSES is set: models load in the inference processes of each worker")
+    else:
+        from inference_pipeline_update import active_model_names
+
+        start = time.perf_counter()
+        shared = [name for name in active_model_names() if name in FORK_SAFE_MODELS]
+        load_all_models(shared, warm_up=False)
+        print(f"Shared models {shared} loaded in {time.perf_counter() - start:.1f}s: {_memory()}")
+    # Everything loaded so far is shared with the workers; keep the GC from writing to it
+    gc.freeze()
+
+    options = {
+        "bind": SERVER_BIND,
+        "workers": SERVER_WORKERS,
+        "threads": SERVER_THREADS,
+        "worker_class": "gthread",
+        "graceful_timeout": GRACEFUL_TIMEOUT,
+        "timeout": WORKER_TIMEOUT,
+        "preload_app": True,
+        "pidfile": SERVER_PIDFILE,
+        "when_ready": when_ready,
+        "pre_fork": pre_fork,
+        "post_worker_init": post_worker_init,
+        "worker_exit": worker_exit,
+        "on_reload": on_reload,
+    }
+    print(f"Starting {SERVER_WORKERS} workers x {SERVER_THREADS} threads")
+    PreforkServer(web_app.app, options).run()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,108 @@
+"""
+This script trains and benchmarks the trash classifier at several input resolutions,
+to find the cheapest model with acceptable accuracy.
+For every resolution it:
+- prepares a TacoCropped dataset whose crops are saved at that resolution
+  (so no variant is trained on upscaled crops),
+- trains a classifier with that input size (skipped if the model already exists),
+- measures validation accuracy and inference latency.
+The results are printed as an accuracy-vs-latency table and saved to a CSV file.
+A chosen model can be served by pointing TRASH_CLASSIFIER_PATH at it.
+"""
+
+import os
+import sys
+import csv
+import time
+
+import numpy as np
+from tensorflow.keras.models import load_model
+
+from prepare_taco_cropped import prepare_dataset, dataset_dir_for_size
+from train_trash_classifier_on_cropped import train_classifier
+from evaluate_trash_classifier import create_val_generator
+
+RESOLUTIONS = [96, 128, 160, 224, 256]
+EPOCHS = 50
+
+# Batch sizes used for the latency benchmark (1 = a single detection, 16 = a busy frame)
+BENCHMARK_BATCH_SIZES = [1, 16]
+BENCHMARK_RUNS = 50
+
+RESULTS_CSV = "classifier_resolution_sweep.csv"
+
+
+def model_path_for_size(size):
+    return f"trash_classifier_taco_cropped_{size}.h5"
+
+
+def ensure_dataset(size):
+    dataset_dir = dataset_dir_for_size(size)
+    if os.path.isdir(dataset_dir) and any(files for _, _, files in os.walk(dataset_dir)):
+        print(f"Using existing dataset {dataset_dir}")
+    else:
+        prepare_dataset(crop_size=size, output_dir=dataset_dir)
+    return dataset_dir
+
+
+def validation_accuracy(model, dataset_dir, size):
+    val_generator = create_val_generator(dataset_dir, (size, size), batch_size=32)
+    predictions = model.predict(val_generator, verbose=0)
+    return float(np.mean(np.argmax(predictions, axis=1) == val_generator.classes))
+
+
+def benchmark_latency(model, size, batch_size, runs=BENCHMARK_RUNS):
+    """Median milliseconds per forward pass of a batch of the given size."""
+    batch = np.random.rand(batch_size, size, size, 3).astype("float32")
+    for _ in range(5):
+        model.predict_on_batch(batch)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        model.predict_on_batch(batch)
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    results = []
+    for size in RESOLUTIONS:
+        print(f"===== {size}x{size} =====")
+        dataset_dir = ensure_dataset(size)
+        model_path = model_path_for_size(size)
+        if os.path.exists(model_path):
+            print(f"Using existing model {model_path}")
+            model = load_model(model_path, compile=False)
+        else:
+            model, _ = train_classifier(dataset_dir, img_size=size, epochs=EPOCHS, model_save_path=model_path)
+
+        row = {
+            "resolution": size,
+            "model_path": model_path,
+            "params": model.count_params(),
+            "accuracy": validation_accuracy(model, dataset_dir, size),
+        }
+        for batch_size in BENCHMARK_BATCH_SIZES:
+            row[f"ms_batch{batch_size}"] = benchmark_latency(model, size, batch_size)
+        results.append(row)
+
+    print()
+    header = f"{'Resolution':>10}{'Accuracy':>10}" + "".join(f"{f'ms (batch {b})':>16}" for b in BENCHMARK_BATCH_SIZES)
+    print(header)
+    for row in results:
+        print(f"{row['resolution']:>10}{row['accuracy']:>10.4f}" +
+              "".join(f"{row[f'ms_batch{b}']:>16.2f}" for b in BENCHMARK_BATCH_SIZES))
+
+    with open(RESULTS_CSV, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"Results saved to '{RESULTS_CSV}'.")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
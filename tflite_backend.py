@@ -0,0 +1,75 @@
+"""
+TensorFlow Lite version of the trash classifier.
+
+Runs the float16 or INT8 models produced by convert_classifier_tflite.py.
+The TFLite interpreter uses the XNNPACK CPU delegate by default, with a
+configurable number of threads. Uses the small tflite_runtime package when it
+is installed and falls back to the interpreter bundled with TensorFlow.
+"""
+
+import threading
+
+import numpy as np
+
+
+def _interpreter_class():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite import Interpreter
+    return Interpreter
+
+
+def _quantize(values, details):
+    scale, zero_point = details["quantization"]
+    if scale == 0:
+        return values.astype(details["dtype"])
+    info = np.iinfo(details["dtype"])
+    return np.clip(np.round(values / scale + zero_point), info.min, info.max).astype(details["dtype"])
+
+
+def _dequantize(values, details):
+    scale, zero_point = details["quantization"]
+    if scale == 0:
+        return values.astype(np.float32)
+    return (values.astype(np.float32) - zero_point) * scale
+
+
+class TFLiteClassifier:
+    """Trash classifier running on the TFLite interpreter (NHWC float input in [0, 1])."""
+
+    def __init__(self, model_path, num_threads=None):
+        self.interpreter = _interpreter_class()(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_details = self.interpreter.get_input_details()[0]
+        self.output_details = self.interpreter.get_output_details()[0]
+        # (batch, height, width, channels)
+        self.input_size = int(self.input_details["shape"][1])
+        self._batch_size = int(self.input_details["shape"][0])
+        # The interpreter keeps state between set_tensor and get_tensor
+        self._lock = threading.Lock()
+
+    def _resize_batch(self, batch_size):
+        shape = list(self.input_details["shape"])
+        shape[0] = batch_size
+        self.interpreter.resize_tensor_input(self.input_details["index"], shape)
+        self.interpreter.allocate_tensors()
+        self._batch_size = batch_size
+
+    def predict(self, batch):
+        """Class probabilities for a (N, H, W, 3) float32 batch."""
+        with self._lock:
+            if len(batch) != self._batch_size:
+                self._resize_batch(len(batch))
+
+            if self.input_details["dtype"] == np.float32:
+                model_input = np.ascontiguousarray(batch, dtype=np.float32)
+            else:
+                model_input = _quantize(batch, self.input_details)
+            self.interpreter.set_tensor(self.input_details["index"], model_input)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self.output_details["index"])
+
+        if self.output_details["dtype"] == np.float32:
+            return output.copy()
+        return _dequantize(output, self.output_details)
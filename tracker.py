@@ -0,0 +1,190 @@
+"""
+IoU tracker with a constant-velocity Kalman filter per box.
+
+Carries detections of the pipeline across frames, so the live stream can run
+YOLO only every few frames and move the boxes in between. Detections are
+matched to tracks greedily by IoU with the tracks' predicted boxes. Each
+track keeps the label the classifier gave it, and a detection matched to a
+track reuses that label until its box has moved or changed size enough that
+the old crop no longer describes it.
+"""
+
+import itertools
+
+import numpy as np
+
+# Fields of a detection that come from the classifier (or ROI head) and are cached per track
+LABEL_FIELDS = ("class_label", "class_confidence", "label_source")
+
+
+def box_iou(box_a, box_b):
+    """IoU of two x1, y1, x2, y2 boxes."""
+    x1 = max(box_a[0], box_b[0])
+    y1 = max(box_a[1], box_b[1])
+    x2 = min(box_a[2], box_b[2])
+    y2 = min(box_a[3], box_b[3])
+    inter = max(x2 - x1, 0) * max(y2 - y1, 0)
+    union = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1]) + (box_b[2] - box_b[0]) * (box_b[3] - box_b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class KalmanBoxTrack:
+    """
+    One tracked box. The state is the box center, width and height plus their
+    velocities per frame; only center, width and height are measured.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, detection, process_noise=1e-2, measurement_noise=1e-1):
+        self.id = next(self._ids)
+        x1, y1, x2, y2 = detection["bbox"]
+        self.x = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1, 0, 0, 0, 0], dtype=np.float64)
+        # Positions start certain, velocities unknown
+        self.P = np.diag([10, 10, 10, 10, 1e3, 1e3, 1e3, 1e3]).astype(np.float64)
+        self.F = np.eye(8)
+        self.F[:4, 4:] = np.eye(4)
+        self.H = np.eye(4, 8)
+        # Noise scales with the box size, so small and large boxes are tracked alike
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.detection = detection
+        self.hits = 1
+        self.missed = 0
+        self.age = 0
+        # Box and label fields of the last classification
+        self.classified_box = None
+        self.label = None
+
+    def _size_scale(self):
+        return max(self.x[2], self.x[3], 1.0)
+
+    def predict(self):
+        """Move the box one frame ahead."""
+        scale = self._size_scale()
+        Q = np.eye(8) * (self.process_noise * scale) ** 2
+        self.x = self.F @ self.x
+        # Width and height cannot go below one pixel
+        self.x[2:4] = np.maximum(self.x[2:4], 1.0)
+        self.P = self.F @ self.P @ self.F.T + Q
+        self.age += 1
+
+    def update(self, detection):
+        """Correct the state with a matched detection."""
+        x1, y1, x2, y2 = detection["bbox"]
+        z = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=np.float64)
+        R = np.eye(4) * (self.measurement_noise * self._size_scale()) ** 2
+        S = self.H @ self.P @ self.H.T + R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (z - self.H @ self.x)
+        self.P = (np.eye(8) - K @ self.H) @ self.P
+        self.detection = detection
+        self.hits += 1
+        self.missed = 0
+
+    @property
+    def box(self):
+        cx, cy, w, h = self.x[:4]
+        return [cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2]
+
+
+class IouTracker:
+    """
+    Tracks pipeline detections between detector runs.
+    update() takes the detections of a detector run and returns the ones that
+    need the classifier; predict() moves the tracks on frames without a
+    detector run; detections() lists the current tracks in the pipeline's
+    detection format, with a track_id.
+    """
+
+    def __init__(self, match_iou=0.3, reclassify_iou=0.6, max_missed=2):
+        self.match_iou = match_iou
+        self.reclassify_iou = reclassify_iou
+        self.max_missed = max_missed
+        self.tracks = []
+        self.lost_tracks = 0
+        self.label_reuses = 0
+        self.classifications = 0
+
+    def predict(self):
+        for track in self.tracks:
+            track.predict()
+
+    def update(self, detections):
+        """Match a detector run's detections to the tracks. Returns the detections to classify."""
+        self.predict()
+
+        # Greedy matching, best overlapping pairs first
+        pairs = sorted(((box_iou(track.box, det["bbox"]), t, d)
+                        for t, track in enumerate(self.tracks)
+                        for d, det in enumerate(detections)), reverse=True)
+        matched_tracks = set()
+        matched_detections = set()
+        to_classify = []
+        for iou, t, d in pairs:
+            if iou < self.match_iou:
+                break
+            if t in matched_tracks or d in matched_detections:
+                continue
+            matched_tracks.add(t)
+            matched_detections.add(d)
+            track, detection = self.tracks[t], detections[d]
+            track.update(detection)
+            detection["track_id"] = track.id
+            if track.label is not None and box_iou(track.classified_box, detection["bbox"]) >= self.reclassify_iou:
+                detection.update(track.label)
+                self.label_reuses += 1
+            else:
+                to_classify.append(detection)
+
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    self.lost_tracks += 1
+                    continue
+            survivors.append(track)
+        for d, detection in enumerate(detections):
+            if d not in matched_detections:
+                track = KalmanBoxTrack(detection)
+                detection["track_id"] = track.id
+                survivors.append(track)
+                to_classify.append(detection)
+        self.tracks = survivors
+        return to_classify
+
+    def set_labels(self, classified):
+        """Cache the labels of classified detections (from update) on their tracks."""
+        by_id = {track.id: track for track in self.tracks}
+        for detection in classified:
+            track = by_id.get(detection.get("track_id"))
+            if track is None:
+                continue
+            track.label = {field: detection[field] for field in LABEL_FIELDS}
+            track.classified_box = list(detection["bbox"])
+            track.detection = detection
+            self.classifications += 1
+
+    def has_unmatched_tracks(self):
+        """True if a track was missed by the last detector run (it may have left the frame or been lost)."""
+        return any(track.missed for track in self.tracks)
+
+    def detections(self, image_shape=None):
+        """Detection dicts of the current tracks, with their predicted boxes, clipped to image_shape."""
+        output = []
+        for track in self.tracks:
+            x1, y1, x2, y2 = track.box
+            if image_shape is not None:
+                h, w = image_shape[:2]
+                x1, x2 = np.clip([x1, x2], 0, w - 1)
+                y1, y2 = np.clip([y1, y2], 0, h - 1)
+            if x2 <= x1 or y2 <= y1:
+                continue
+            detection = dict(track.detection)
+            detection.update(track.label or {})
+            detection["bbox"] = [int(x1), int(y1), int(x2), int(y2)]
+            detection["track_id"] = track.id
+            detection["track_age"] = track.age
+            output.append(detection)
+        return output
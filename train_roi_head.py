@@ -0,0 +1,136 @@
+"""
+This script trains the ROI classification head (roi_feature_head.py) on the TACO annotations.
+The trained YOLO detector is frozen. For every annotated object, its P3/P4/P5 neck
+features are pooled inside the ground-truth box, and the labels come from the same
+category mapping as prepare_taco_cropped.py.
+Pooled features are computed once and cached, so every epoch only trains the small head.
+After training, the head is saved as 'roi_head_taco.pt' (see ROI_HEAD_PATH in model_registry.py).
+"""
+
+import os
+import sys
+import random
+
+import cv2
+import numpy as np
+import torch
+from torch import nn
+
+from prepare_taco_cropped import TACO_DATA_PATH, TRASHNET_CATEGORIES, load_annotations, map_category_to_trashnet
+from model_registry import YOLO_MODEL_PATH, ROI_HEAD_PATH
+from roi_feature_head import RoiClassificationHead, YoloFeatureExtractor, build_rois, ROI_OUTPUT_SIZE
+
+# Same class order as the Keras classifier (alphabetical, like flow_from_directory)
+CLASS_NAMES = sorted(TRASHNET_CATEGORIES)
+
+VALIDATION_SPLIT = 0.2
+EPOCHS = 30
+BATCH_SIZE = 64
+LEARNING_RATE = 1e-3
+
+
+def extract_pooled_features(extractor, head, images_info, image_id_to_objects, cat_id_to_details):
+    """Pooled features (one tensor per feature level) and labels of every annotated object."""
+    pooled_levels = None
+    labels = []
+    for img_info in images_info:
+        img_path = os.path.join(TACO_DATA_PATH, img_info["file_name"])
+        img = cv2.imread(img_path) if os.path.exists(img_path) else None
+        if img is None:
+            continue
+
+        boxes = []
+        for cat_id, (x, y, w, h) in image_id_to_objects.get(img_info["id"], []):
+            if w <= 1 or h <= 1:
+                continue
+            cat_name, cat_super = cat_id_to_details.get(cat_id, ("", ""))
+            boxes.append([x, y, x + w, y + h])
+            labels.append(CLASS_NAMES.index(map_category_to_trashnet(cat_name, cat_super)))
+        if not boxes:
+            continue
+
+        _, features, input_hw = extractor.predict([img])
+        rois = build_rois([np.array(boxes, dtype=np.float32)], [img.shape], input_hw).to(features[0].device)
+        with torch.no_grad():
+            pooled = [p.cpu() for p in head.pool(features, rois, extractor.strides)]
+        if pooled_levels is None:
+            pooled_levels = [[] for _ in pooled]
+        for level, p in zip(pooled_levels, pooled):
+            level.append(p)
+
+    return [torch.cat(level) for level in pooled_levels], torch.tensor(labels)
+
+
+def accuracy(head, pooled, labels):
+    head.eval()
+    with torch.no_grad():
+        predictions = head.classify_pooled(pooled).argmax(dim=1)
+    return float((predictions == labels).float().mean())
+
+
+def main():
+    from ultralytics import YOLO
+
+    images_info, cat_id_to_details, image_id_to_objects = load_annotations()
+
+    # Split by image, so objects of one photo never end up on both sides
+    random.Random(0).shuffle(images_info)
+    num_val = int(len(images_info) * VALIDATION_SPLIT)
+    val_images, train_images = images_info[:num_val], images_info[num_val:]
+
+    extractor = YoloFeatureExtractor(YOLO(YOLO_MODEL_PATH))
+    # One dummy run to find out the channels of each feature level
+    _, features, _ = extractor.predict([np.zeros((640, 640, 3), dtype=np.uint8)])
+    head = RoiClassificationHead([f.shape[1] for f in features], num_classes=len(CLASS_NAMES))
+
+    print("Extracting pooled YOLO features...")
+    train_pooled, train_labels = extract_pooled_features(extractor, head, train_images,
+                                                         image_id_to_objects, cat_id_to_details)
+    val_pooled, val_labels = extract_pooled_features(extractor, head, val_images,
+                                                     image_id_to_objects, cat_id_to_details)
+    print(f"Train objects: {len(train_labels)}, validation objects: {len(val_labels)}")
+
+    optimizer = torch.optim.AdamW(head.parameters(), lr=LEARNING_RATE, weight_decay=1e-4)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=EPOCHS)
+    # Weight classes by inverse frequency, since TACO is dominated by plastic
+    counts = torch.bincount(train_labels, minlength=len(CLASS_NAMES)).float().clamp(min=1)
+    loss_fn = nn.CrossEntropyLoss(weight=counts.sum() / counts)
+
+    best_acc = -1.0
+    for epoch in range(EPOCHS):
+        head.train()
+        order = torch.randperm(len(train_labels))
+        total_loss = 0.0
+        for start in range(0, len(order), BATCH_SIZE):
+            idx = order[start:start + BATCH_SIZE]
+            if len(idx) < 2:
+                continue  # BatchNorm needs more than one sample
+            logits = head.classify_pooled([level[idx] for level in train_pooled])
+            loss = loss_fn(logits, train_labels[idx])
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(idx)
+        scheduler.step()
+
+        val_acc = accuracy(head, val_pooled, val_labels)
+        print(f"Epoch {epoch + 1}/{EPOCHS}: loss {total_loss / len(order):.4f}, val accuracy {val_acc:.4f}")
+        if val_acc > best_acc:
+            best_acc = val_acc
+            torch.save({
+                "state_dict": head.state_dict(),
+                "in_channels": head.in_channels,
+                "class_names": CLASS_NAMES,
+                "output_size": ROI_OUTPUT_SIZE,
+            }, ROI_HEAD_PATH)
+
+    print(f"ROI head trained on TACO annotations and saved as '{ROI_HEAD_PATH}' "
+          f"(best val accuracy {best_acc:.4f}).")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
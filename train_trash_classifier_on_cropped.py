@@ -1,7 +1,8 @@
 """
 This script trains a trash classifier using Transfer Learning on cropped TACO images.
 We use MobileNetV2 as the base model (pretrained on ImageNet) and fine-tune the last 30 layers.
-The input images are resized to 256x256.
+The input images are IMG_SIZE x IMG_SIZE (256 by default), trained on crops saved at that size
+(prepared first if missing), so they are never upscaled.
 The model classifies images into 6 trash categories.
 After training, the model is saved as 'trash_classifier_taco_cropped.h5'.
 """
@@ -17,6 +18,15 @@ from tensorflow.keras.layers import GlobalAveragePooling2D, Dropout, Dense
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
 
+from prepare_taco_cropped import prepare_dataset, dataset_dir_for_size
+
+# Side length of the classifier input. Inference reads it back from the saved model.
+IMG_SIZE = 256
+
+# Path to the cropped TACO dataset whose crops are IMG_SIZE pixels
+# (structure: TacoCropped_<size>/plastic, metal, paper, glass, cardboard, trash)
+DATASET_DIR = dataset_dir_for_size(IMG_SIZE)
+
 def create_finetuned_model(input_shape=(256, 256, 3), num_classes=6):
     # Load MobileNetV2 with ImageNet weights, without the top layers
     base_model = MobileNetV2(weights="imagenet", include_top=False, input_shape=input_shape)
@@ -42,10 +52,9 @@ def create_finetuned_model(input_shape=(256, 256, 3), num_classes=6):
                   metrics=["accuracy"])
     return model
 
-def main():
-    # Path to the cropped TACO dataset (structure: TacoCropped/plastic, metal, paper, glass, cardboard, trash)
-    dataset_dir = r"C:\Users\User\Desktop\Noa Project\Taco\TACO-master\data\TacoCropped"
-    
+def train_classifier(dataset_dir=DATASET_DIR, img_size=IMG_SIZE, epochs=50,
+                     model_save_path="trash_classifier_taco_cropped.h5"):
+    """Train a classifier with img_size x img_size inputs and save it. Returns (model, history)."""
     train_datagen = ImageDataGenerator(
         rescale=1./255,
         validation_split=0.2,
@@ -60,7 +69,7 @@ def main():
     
     train_generator = train_datagen.flow_from_directory(
         dataset_dir,
-        target_size=(256, 256),
+        target_size=(img_size, img_size),
         batch_size=32,
         class_mode="categorical",
         subset="training"
@@ -68,7 +77,7 @@ def main():
     
     val_generator = train_datagen.flow_from_directory(
         dataset_dir,
-        target_size=(256, 256),
+        target_size=(img_size, img_size),
         batch_size=32,
         class_mode="categorical",
         subset="validation"
@@ -80,19 +89,24 @@ def main():
     idx_to_class = {v: k for k, v in val_generator.class_indices.items()}
     print("Index to class mapping from val generator:", idx_to_class)
 
-    model = create_finetuned_model(input_shape=(256,256,3), num_classes=6)
+    model = create_finetuned_model(input_shape=(img_size, img_size, 3), num_classes=6)
     model.summary()
     
     history = model.fit(
         train_generator,
         validation_data=val_generator,
-        epochs=50,
+        epochs=epochs,
         verbose=1
     )
     
-    model_save_path = "trash_classifier_taco_cropped.h5"
     model.save(model_save_path)
     print(f"Model trained on cropped TACO dataset and saved as '{model_save_path}'.")
+    return model, history
+
+def main():
+    if not os.path.isdir(DATASET_DIR):
+        prepare_dataset(crop_size=IMG_SIZE, output_dir=DATASET_DIR)
+    model, history = train_classifier(DATASET_DIR, img_size=IMG_SIZE)
     
     plt.figure(figsize=(12,5))
     plt.subplot(1,2,1)